@@ -0,0 +1,123 @@
+import bisect
+import math
+import re
+
+
+class P2Quantile:
+    def __init__(self, p: float):
+        self.p = p
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x: float):
+        q = self.heights
+        if len(q) < 5:
+            bisect.insort(q, x)
+            return
+
+        n = self.positions
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = bisect.bisect_right(q, x) - 1
+
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = self.__parabolic(i, d)
+                if not q[i - 1] < height < q[i + 1]:
+                    height = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = height
+                n[i] += d
+
+    def __parabolic(self, i, d):
+        q = self.heights
+        n = self.positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def value(self):
+        q = self.heights
+        if not q:
+            return None
+        if self.positions[4] > 5:
+            return q[2]
+        return q[min(len(q) - 1, int(round(self.p * (len(q) - 1))))]
+
+
+class Aggregator:
+    reducers = ("mean", "min", "max", "last", "count", "variance", "stddev")
+
+    def __init__(self, reducers: tuple):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.last = None
+        self.quantiles = {
+            reducer: P2Quantile(Aggregator.get_quantile(reducer))
+            for reducer in reducers
+            if reducer not in Aggregator.reducers
+        }
+
+    @staticmethod
+    def get_quantile(reducer: str) -> float:
+        match = re.fullmatch(r"p(\d{1,2}(\.\d+)?)", reducer)
+        if match is None:
+            raise Exception("Invalid aggregate reducer: " + reducer)
+        return float(match.group(1)) / 100
+
+    @staticmethod
+    def validate(reducers: tuple):
+        if not reducers:
+            raise Exception("At least one aggregate reducer is required")
+        for reducer in reducers:
+            if reducer not in Aggregator.reducers:
+                Aggregator.get_quantile(reducer)
+
+    def add(self, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.last = value
+        for quantile in self.quantiles.values():
+            quantile.add(value)
+
+    def get(self, reducer: str):
+        if self.count == 0:
+            return None
+        if reducer == "mean":
+            return self.mean
+        if reducer == "min":
+            return self.min
+        if reducer == "max":
+            return self.max
+        if reducer == "last":
+            return self.last
+        if reducer == "count":
+            return self.count
+        if reducer == "variance":
+            return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+        if reducer == "stddev":
+            return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+        return self.quantiles[reducer].value()
@@ -0,0 +1,274 @@
+import collections
+import random
+import sys
+import threading
+import time
+import types
+
+
+class Settings:
+    i2c_latency = 0.0005
+    i2c_error_rate = 0.0
+    mqtt_latency = 0.0001
+
+
+def simulate_bus():
+    if Settings.i2c_latency:
+        time.sleep(Settings.i2c_latency)
+    if Settings.i2c_error_rate and random.random() < Settings.i2c_error_rate:
+        raise OSError(121, "Remote I/O error")
+
+
+class SMBus:
+    def __init__(self, bus=None):
+        self.bus = bus
+        self.transactions = 0
+        self.bytes = 0
+
+    def read_i2c_block_data(self, address, register, length):
+        simulate_bus()
+        self.transactions += 1
+        self.bytes += length
+        return [(register + i) & 0xFF for i in range(length)]
+
+    def i2c_rdwr(self, *messages):
+        simulate_bus()
+        self.transactions += 1
+        register = 0
+        for message in messages:
+            if message.flags:
+                for i in range(message.len):
+                    message.buf[i] = (register + i) & 0xFF
+                self.bytes += message.len
+            else:
+                register = message.buf[0]
+
+    def close(self):
+        pass
+
+
+class I2cMsg:
+    def __init__(self, address, flags, data):
+        self.addr = address
+        self.flags = flags
+        self.buf = bytearray(data)
+        self.len = len(self.buf)
+
+    @staticmethod
+    def read(address, length):
+        return I2cMsg(address, 1, bytes(length))
+
+    @staticmethod
+    def write(address, data):
+        return I2cMsg(address, 0, data)
+
+    @staticmethod
+    def write(address, data):
+        return I2cMsg(address, 0, bytes(data))
+
+    def __iter__(self):
+        return iter(self.buf)
+
+    def __bytes__(self):
+        return bytes(self.buf)
+
+
+class Htu31d:
+    def __init__(self, i2c=None, address=0x40):
+        self.address = address
+
+    @property
+    def measurements(self):
+        simulate_bus()
+        return 20 + random.random(), 40 + random.random()
+
+    @property
+    def temperature(self):
+        return self.measurements[0]
+
+    @property
+    def relative_humidity(self):
+        return self.measurements[1]
+
+
+AirQuality = collections.namedtuple("AirQuality", "equivalent_co2 total_voc")
+
+
+class Sgp30:
+    def __init__(self, i2c_dev=None, i2c_msg=None, i2c_addr=0x58):
+        # Like the real driver, the message class is only imported when no bus
+        # is given, so passing a bus without i2c_msg fails on the first command
+        self.address = i2c_addr
+        self.i2c_dev = i2c_dev
+        self.i2c_msg = i2c_msg
+        if i2c_dev is None:
+            self.i2c_dev = SMBus(1)
+            self.i2c_msg = I2cMsg
+
+    def command(self):
+        self.i2c_msg.write(self.address, [])
+
+    def start_measurement(self):
+        self.command()
+
+    def get_unique_id(self):
+        self.command()
+        return self.address
+
+    def get_air_quality(self):
+        self.command()
+        simulate_bus()
+        return AirQuality(400 + random.randint(0, 50), random.randint(0, 20))
+
+    def get_baseline(self):
+        return AirQuality(0, 0)
+
+    def set_baseline(self, co2, voc):
+        pass
+
+
+class Scd30:
+    def __init__(self, *args, **kwargs):
+        self.interval = 2
+        self.last = time.monotonic()
+
+    def set_measurement_interval(self, interval):
+        self.interval = interval
+
+    def start_periodic_measurement(self):
+        self.last = time.monotonic()
+
+    def get_data_ready(self):
+        simulate_bus()
+        return time.monotonic() - self.last >= self.interval
+
+    def read_measurement(self):
+        simulate_bus()
+        self.last = time.monotonic()
+        return 600 + random.random(), 21 + random.random(), 45 + random.random()
+
+
+class Broker:
+    lock = threading.Lock()
+    messages = 0
+    topics = {}
+
+    @staticmethod
+    def publish(topic, payload):
+        with Broker.lock:
+            Broker.messages += 1
+            Broker.topics[topic] = payload
+
+
+class MessageInfo:
+    def __init__(self, mid):
+        self.mid = mid
+        self.rc = 0
+        self.published = False
+
+    def __getitem__(self, index):
+        return (self.rc, self.mid)[index]
+
+    def wait_for_publish(self, timeout=None):
+        self.published = True
+
+    def is_published(self):
+        return self.published
+
+
+class MqttClient:
+    def __init__(self, client_id="", *args, **kwargs):
+        self.client_id = client_id
+        self.connected = False
+        self.mid = 0
+        self.on_connect = None
+        self.on_disconnect = None
+
+    def username_pw_set(self, username, password=None):
+        pass
+
+    def reconnect_delay_set(self, min_delay=1, max_delay=120):
+        pass
+
+    def connect(self, host, port=1883, *args, **kwargs):
+        self.connected = True
+        if self.on_connect is not None:
+            self.on_connect(self, None, {}, 0)
+        return 0
+
+    def is_connected(self):
+        return self.connected
+
+    def loop_start(self):
+        pass
+
+    def loop_stop(self):
+        pass
+
+    def loop(self, timeout=1.0):
+        return 0
+
+    def disconnect(self):
+        self.connected = False
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        if Settings.mqtt_latency:
+            time.sleep(Settings.mqtt_latency)
+        Broker.publish(topic, payload)
+        self.mid += 1
+        return MessageInfo(self.mid)
+
+
+class Response:
+    status_code = 200
+    text = "{}"
+
+
+class Session:
+    def post(self, *args, **kwargs):
+        return Response()
+
+
+def module(name, **attributes):
+    result = types.ModuleType(name)
+    result.__dict__.update(attributes)
+    sys.modules[name] = result
+    return result
+
+
+def install():
+    gpio = module(
+        "RPi.GPIO",
+        BCM=11,
+        OUT=0,
+        IN=1,
+        LOW=0,
+        HIGH=1,
+        setmode=lambda mode: None,
+        setup=lambda pin, mode: None,
+        output=lambda pin, value: None,
+    )
+    module("RPi", GPIO=gpio)
+    module("smbus2", SMBus=SMBus, i2c_msg=I2cMsg)
+    module("board", I2C=lambda: object())
+    module("adafruit_htu31d", HTU31D=Htu31d)
+    module("adafruit_shtc3", SHTC3=Htu31d)
+    module("adafruit_ahtx0", AHTx0=Htu31d)
+    module("adafruit_bme680", Adafruit_BME680_I2C=Htu31d)
+    module("sgp30", SGP30=Sgp30)
+    module("scd30_i2c", SCD30=Scd30)
+
+    client = module(
+        "paho.mqtt.client",
+        Client=MqttClient,
+        MQTTMessageInfo=MessageInfo,
+        MQTT_ERR_SUCCESS=0,
+        MQTT_ERR_NO_CONN=4,
+    )
+    mqtt = module("paho.mqtt", client=client)
+    module("paho", mqtt=mqtt)
+
+    exceptions = module(
+        "requests.exceptions", RequestException=type("RequestException", (OSError,), {})
+    )
+    module("requests", Session=Session, exceptions=exceptions)
@@ -0,0 +1,236 @@
+#!/usr/bin/python3
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+import fakes
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+READOUTS = {
+    "i2c": [
+        ("a", {"I2C": {"Register": 0, "Length": 2}}),
+        ("b", {"I2C": {"Register": 2, "Length": 2}, "Scale": 100}),
+    ],
+    "htu31d": [
+        ("t", {"HTU31D": {"Index": "temperature"}}),
+        ("h", {"HTU31D": {"Index": "relative_humidity"}}),
+    ],
+    "scd30": [
+        ("co2", {"SCD30": {"Index": "co2"}}),
+        ("t", {"SCD30": {"Index": "temperature"}}),
+        ("h", {"SCD30": {"Index": "humidity"}}),
+    ],
+    "sgp30": [
+        ("co2", {"SGP30": {"Index": "equivalent_co2"}}),
+        ("voc", {"SGP30": {"Index": "total_voc"}}),
+    ],
+    "random": [],
+}
+
+
+def build_config(args) -> dict:
+    backends = args.backends.split(",")
+    sensors = []
+    for i in range(args.sensors):
+        backend = backends[i % len(backends)]
+        name = "sensor" + str(i)
+        sensor = {
+            "Name": name,
+            "Group": "benchmark",
+            "Backend": backend,
+            "Interval": args.interval,
+            "I2C": {"Bus": 1 + i % args.buses, "Address": 0x10 + i % 100},
+        }
+        readouts = {}
+        for key, readout in READOUTS[backend]:
+            readouts[key] = dict(readout, Name=name + "-" + key)
+        if readouts:
+            sensor["Readouts"] = readouts
+        if backend == "sgp30":
+            sensor["SGP30"] = {"BootDelay": "0"}
+        sensors.append(sensor)
+
+    return {
+        "Interval": args.send_interval,
+        "MQTT": {"Broker": "localhost"},
+        "Sensors": sensors,
+    }
+
+
+def percentile(values: list, p: float):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p * (len(values) - 1))))]
+
+
+def run_child(args) -> dict:
+    fakes.Settings.i2c_latency = args.i2c_latency
+    fakes.Settings.i2c_error_rate = args.i2c_error_rate
+    fakes.Settings.mqtt_latency = args.mqtt_latency
+    fakes.install()
+    sys.path.insert(0, ROOT)
+
+    from config import Config
+    from scheduler import Scheduler
+    from sensormonitor import SensorMonitor
+
+    Config.data = build_config(args)
+    SensorMonitor.latest_data = {}
+    SensorMonitor.lock = threading.Lock()
+
+    started = time.perf_counter()
+    SensorMonitor.setup_sensors()
+    setup_seconds = time.perf_counter() - started
+
+    read_latencies = []
+    samples = []
+
+    def read(sensor):
+        read_started = time.perf_counter()
+        data = SensorMonitor.read_sensor(sensor)
+        read_latencies.append(time.perf_counter() - read_started)
+        if data:
+            samples.append(len(data))
+
+    schedulers = {}
+    for sensor in SensorMonitor.sensors:
+        if sensor.bus not in schedulers:
+            schedulers[sensor.bus] = Scheduler()
+        schedulers[sensor.bus].add(sensor)
+
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    for scheduler in schedulers.values():
+        threading.Thread(target=scheduler.run, args=(read,), daemon=True).start()
+
+    publish_latencies = []
+    send_interval = Config.get_interval()
+    deadline = started + args.duration
+    while time.perf_counter() < deadline:
+        time.sleep(min(send_interval, max(0.0, deadline - time.perf_counter())))
+        publish_started = time.perf_counter()
+        SensorMonitor.send_entries(SensorMonitor.collect_entries())
+        publish_latencies.append(time.perf_counter() - publish_started)
+
+    wall = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+
+    return {
+        "sensors": len(SensorMonitor.sensors),
+        "readouts": sum(len(sensor.readouts) for sensor in SensorMonitor.sensors),
+        "buses": len(schedulers),
+        "setup_seconds": setup_seconds,
+        "duration_seconds": wall,
+        "reads": len(read_latencies),
+        "reads_per_second": len(read_latencies) / wall,
+        "samples_per_second": sum(samples) / wall,
+        "read_latency_ms": {
+            "p50": percentile(read_latencies, 0.5) * 1000 if read_latencies else None,
+            "p95": percentile(read_latencies, 0.95) * 1000 if read_latencies else None,
+            "max": max(read_latencies) * 1000 if read_latencies else None,
+        },
+        "publish_latency_ms": {
+            "mean": sum(publish_latencies) / len(publish_latencies) * 1000,
+            "max": max(publish_latencies) * 1000,
+        },
+        "messages_published": fakes.Broker.messages,
+        "cpu_percent": cpu / wall * 100,
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "threads": threading.active_count(),
+    }
+
+
+def get_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Hardware-free SensorMonitor benchmark"
+    )
+    parser.add_argument("--sizes", default="1,10,100,1000")
+    parser.add_argument("--sensors", type=int, default=1)
+    parser.add_argument("--buses", type=int, default=4)
+    parser.add_argument("--backends", default="i2c,htu31d,scd30,sgp30,random")
+    parser.add_argument("--interval", default="1s")
+    parser.add_argument("--send-interval", default="2s")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--i2c-latency", type=float, default=0.0005)
+    parser.add_argument("--i2c-error-rate", type=float, default=0.0)
+    parser.add_argument("--mqtt-latency", type=float, default=0.0001)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        logging.basicConfig(level=logging.CRITICAL + 1)
+        print(json.dumps(run_child(args)))
+        sys.stdout.flush()
+        os._exit(0)
+
+    results = []
+    for size in args.sizes.split(","):
+        command = [sys.executable, os.path.abspath(__file__), "--child"]
+        command += ["--sensors", size]
+        for option in (
+            "buses",
+            "backends",
+            "interval",
+            "send_interval",
+            "duration",
+            "i2c_latency",
+            "i2c_error_rate",
+            "mqtt_latency",
+        ):
+            command += ["--" + option.replace("_", "-"), str(getattr(args, option))]
+
+        output = subprocess.run(command, capture_output=True, text=True, check=True)
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        results.append(result)
+        print(
+            "%5d sensors: %8.1f reads/s, publish %.2f ms, cpu %.1f%%, rss %d kB"
+            % (
+                result["sensors"],
+                result["reads_per_second"],
+                result["publish_latency_ms"]["mean"],
+                result["cpu_percent"],
+                result["max_rss_kb"],
+            )
+        )
+
+    report = {
+        "revision": get_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+        "settings": {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ("child", "sensors", "output")
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -29,6 +29,37 @@ class Config:
             Config.load_file(Config.config_file)
         return Config.data
 
+    @staticmethod
+    def get_modified_time():
+        if Config.config_file is None:
+            return None
+        try:
+            return os.path.getmtime(Config.config_file)
+        except OSError:
+            return None
+
+    @staticmethod
+    def reload() -> dict:
+        with open(Config.config_file) as file:
+            data = yaml.safe_load(file)
+        Config.validate(data)
+
+        previous = Config.data
+        Config.data = data
+        return previous
+
+    @staticmethod
+    def validate(data):
+        # Editors may truncate the file before writing it, so a partial config
+        # must never replace the running one
+        if not isinstance(data, dict) or not data:
+            raise Exception("Configuration is empty!")
+        if not isinstance(data.get("Sensors"), list):
+            raise Exception("Configuration has no Sensors list!")
+        if data.get("Interval") is None:
+            raise Exception("Configuration has no Interval!")
+        Config.get_interval(str(data["Interval"]))
+
     @staticmethod
     def get(key: str, default=None, data=None):
         if data is None:
@@ -44,13 +75,24 @@ class Config:
 
     @staticmethod
     def parse_time(value):
-        match = re.fullmatch(r"(\d+)([smh]?)", value)
+        match = re.fullmatch(r"(\d+(\.\d+)?)(ms|[smhd]?)", value)
         if match is None:
             raise Exception("Invalid time string: " + value)
 
+        number = float(match.group(1)) if match.group(2) else int(match.group(1))
+        unit = match.group(3)
+        factor = {"": 1, "ms": 0.001, "s": 1, "m": 60, "h": 3600, "d": 86400}.get(unit)
+        return number * factor
+
+    @staticmethod
+    def parse_size(value):
+        match = re.fullmatch(r"(\d+)([kMG]?)B?", str(value))
+        if match is None:
+            raise Exception("Invalid size string: " + str(value))
+
         number = int(match.group(1))
         unit = match.group(2)
-        factor = {"": 1, "s": 1, "m": 60, "h": 3600}.get(unit)
+        factor = {"": 1, "k": 1024, "M": 1024**2, "G": 1024**3}.get(unit)
         return number * factor
 
     @staticmethod
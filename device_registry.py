@@ -0,0 +1,47 @@
+import logging
+import threading
+
+
+class DeviceHandle:
+    def __init__(self, key: tuple, device):
+        self.key = key
+        self.device = device
+        self.lock = threading.RLock()
+        self.references = 0
+
+
+class DeviceRegistry:
+    lock = threading.Lock()
+    handles: dict = {}
+
+    @staticmethod
+    def acquire(key: tuple, factory) -> DeviceHandle:
+        with DeviceRegistry.lock:
+            handle = DeviceRegistry.handles.get(key)
+            if handle is None:
+                logging.info("Registering device " + DeviceRegistry.format_key(key))
+                handle = DeviceHandle(key, factory())
+                DeviceRegistry.handles[key] = handle
+            handle.references += 1
+            return handle
+
+    @staticmethod
+    def release(handle: DeviceHandle):
+        with DeviceRegistry.lock:
+            handle.references -= 1
+            if handle.references > 0:
+                return
+            if DeviceRegistry.handles.get(handle.key) is handle:
+                del DeviceRegistry.handles[handle.key]
+
+        logging.info("Releasing device " + DeviceRegistry.format_key(handle.key))
+        close = getattr(handle.device, "close", None)
+        if close is not None:
+            with handle.lock:
+                close()
+
+    @staticmethod
+    def format_key(key: tuple) -> str:
+        backend, bus, address = key
+        address = hex(address) if isinstance(address, int) else str(address)
+        return backend + "@" + str(bus) + ":" + address
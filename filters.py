@@ -0,0 +1,145 @@
+import bisect
+import math
+from collections import deque
+
+
+class SortedWindow:
+    def __init__(self, size: int):
+        if size < 1:
+            raise Exception("Filter window must be positive")
+        self.size = size
+        self.values = deque()
+        self.sorted = []
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, value: float):
+        if len(self.values) == self.size:
+            oldest = self.values.popleft()
+            del self.sorted[bisect.bisect_left(self.sorted, oldest)]
+        self.values.append(value)
+        bisect.insort(self.sorted, value)
+
+    def median(self) -> float:
+        s = self.sorted
+        n = len(s)
+        if n % 2:
+            return s[n // 2]
+        return (s[n // 2 - 1] + s[n // 2]) / 2
+
+    def mad(self, median: float) -> float:
+        # The deviations left and right of the median are two sorted sequences,
+        # so their median is a k-th element selection in O(log n)
+        s = self.sorted
+        n = len(s)
+        split = bisect.bisect_left(s, median)
+        left = split
+        right = n - split
+
+        def deviation(k):
+            low = max(0, k + 1 - right)
+            high = min(k + 1, left)
+            while low < high:
+                i = (low + high) // 2
+                j = k + 1 - i
+                if j > 0 and median - s[split - 1 - i] < s[split + j - 1] - median:
+                    low = i + 1
+                else:
+                    high = i
+            i = low
+            j = k + 1 - i
+            result = -math.inf
+            if i > 0:
+                result = median - s[split - i]
+            if j > 0:
+                result = max(result, s[split + j - 1] - median)
+            return result
+
+        if n % 2:
+            return deviation(n // 2)
+        return (deviation(n // 2 - 1) + deviation(n // 2)) / 2
+
+
+class MedianFilter:
+    name = "median"
+
+    def __init__(self, window: int):
+        self.window = SortedWindow(window)
+
+    def apply(self, value: float):
+        self.window.add(value)
+        return self.window.median()
+
+
+class HampelFilter:
+    name = "hampel"
+    scale = 1.4826
+
+    def __init__(self, window: int, threshold: float):
+        self.window = SortedWindow(window)
+        self.threshold = threshold
+
+    def apply(self, value: float):
+        window = self.window
+        window.add(value)
+        if len(window) < 3:
+            return value
+
+        median = window.median()
+        mad = HampelFilter.scale * window.mad(median)
+        if abs(value - median) > self.threshold * mad:
+            return None
+        return value
+
+
+class EmaFilter:
+    name = "ema"
+
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self.value = None
+
+    def apply(self, value: float):
+        if self.value is None:
+            self.value = value
+        else:
+            self.value += self.alpha * (value - self.value)
+        return self.value
+
+
+class Filters:
+    @staticmethod
+    def compile(specs) -> tuple:
+        if isinstance(specs, dict):
+            specs = [specs]
+
+        result = []
+        for spec in specs:
+            name = str(spec.get("Type", "")).lower()
+            if name == "median":
+                result.append((name, (int(spec.get("Window", 5)),)))
+            elif name == "hampel":
+                result.append(
+                    (
+                        name,
+                        (int(spec.get("Window", 7)), float(spec.get("Threshold", 3))),
+                    )
+                )
+            elif name == "ema":
+                alpha = float(spec.get("Alpha", 0.3))
+                if not 0 < alpha <= 1:
+                    raise Exception("Invalid EMA alpha: " + str(alpha))
+                result.append((name, (alpha,)))
+            else:
+                raise Exception("Invalid filter type: " + str(spec.get("Type")))
+
+        for name, args in result:
+            if name != "ema" and args[0] < 1:
+                raise Exception("Invalid filter window: " + str(args[0]))
+        return tuple(result)
+
+    @staticmethod
+    def create(specs: tuple) -> list:
+        classes = {"median": MedianFilter, "hampel": HampelFilter, "ema": EmaFilter}
+        return [classes[name](*args) for name, args in specs]
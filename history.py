@@ -0,0 +1,214 @@
+import logging
+import queue
+import sqlite3
+import threading
+import time
+import traceback
+
+from metrics import Metrics
+
+
+class History:
+    tiers = (
+        ("samples", 0),
+        ("rollup_minute", 60),
+        ("rollup_hour", 3600),
+        ("rollup_day", 86400),
+    )
+    retry_delay = 60
+
+    def __init__(self, file_name: str, retention: dict, lag: float, max_queue: int):
+        self.file_name = file_name
+        self.retention = retention
+        self.lag = lag
+        self.queue = queue.Queue(max_queue)
+        self.series_ids = {}
+        self.connection = None
+        self.thread = None
+        self.last_rollup = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="history", daemon=True)
+        self.thread.start()
+
+    def connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.file_name, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def setup(self):
+        self.connection = self.connect()
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS series"
+                " (id INTEGER PRIMARY KEY, key TEXT NOT NULL UNIQUE)"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS samples"
+                " (series INTEGER NOT NULL, t REAL NOT NULL, value REAL NOT NULL)"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS samples_series_t ON samples (series, t)"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS samples_t ON samples (t)"
+            )
+            for table, size in History.tiers[1:]:
+                self.connection.execute(
+                    "CREATE TABLE IF NOT EXISTS " + table + " (series INTEGER NOT NULL,"
+                    " t REAL NOT NULL, min REAL, mean REAL, max REAL, count INTEGER,"
+                    " PRIMARY KEY (series, t)) WITHOUT ROWID"
+                )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS rollup_state"
+                " (tier TEXT PRIMARY KEY, t REAL NOT NULL)"
+            )
+        for series_id, key in self.connection.execute("SELECT id, key FROM series"):
+            self.series_ids[key] = series_id
+
+    def get_series_id(self, key: str) -> int:
+        if key not in self.series_ids:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO series (key) VALUES (?)", (key,)
+            )
+            self.series_ids[key] = self.connection.execute(
+                "SELECT id FROM series WHERE key = ?", (key,)
+            ).fetchone()[0]
+        return self.series_ids[key]
+
+    def store(self, entries: dict):
+        samples = []
+        for key in entries:
+            buffer = entries[key].buffer
+            if buffer is not None and len(buffer):
+                samples.append((key, buffer.get_times(), buffer.get_values()))
+        if not samples:
+            return
+
+        try:
+            self.queue.put_nowait(samples)
+        except queue.Full:
+            Metrics.increment("history_dropped_total")
+            logging.error("History queue is full, dropping one interval")
+
+    def insert(self, samples: list):
+        with self.connection:
+            for key, times, values in samples:
+                series_id = self.get_series_id(key)
+                self.connection.executemany(
+                    "INSERT INTO samples (series, t, value) VALUES (?, ?, ?)",
+                    zip([series_id] * len(times), times, values),
+                )
+
+    def get_watermark(self, tier: str) -> float:
+        row = self.connection.execute(
+            "SELECT t FROM rollup_state WHERE tier = ?", (tier,)
+        ).fetchone()
+        return row[0] if row is not None else 0.0
+
+    def rollup(self, now: float):
+        until = now - self.lag
+        for i in range(1, len(History.tiers)):
+            source, source_size = History.tiers[i - 1]
+            table, size = History.tiers[i]
+            start = self.get_watermark(table)
+            end = (until // size) * size
+            if end <= start:
+                continue
+
+            if source_size == 0:
+                select = (
+                    "SELECT series, CAST(t / ? AS INTEGER) * ? AS bucket, min(value),"
+                    " avg(value), max(value), count(*) FROM samples"
+                )
+            else:
+                select = (
+                    "SELECT series, CAST(t / ? AS INTEGER) * ? AS bucket, min(min),"
+                    " sum(mean * count) / sum(count), max(max), sum(count) FROM "
+                    + source
+                )
+            with self.connection:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO "
+                    + table
+                    + " "
+                    + select
+                    + " WHERE t >= ? AND t < ? GROUP BY series, bucket",
+                    (size, size, start, end),
+                )
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO rollup_state (tier, t) VALUES (?, ?)",
+                    (table, end),
+                )
+            until = end
+
+    def expire(self, now: float):
+        with self.connection:
+            for table, size in History.tiers:
+                retention = self.retention.get(table)
+                if retention:
+                    self.connection.execute(
+                        "DELETE FROM " + table + " WHERE t < ?", (now - retention,)
+                    )
+
+    def run(self):
+        while True:
+            try:
+                self.setup()
+                break
+            except Exception as e:
+                logging.error(
+                    "History setup failed, retrying in "
+                    + str(History.retry_delay)
+                    + "s: "
+                    + str(e)
+                )
+                if self.connection is not None:
+                    self.connection.close()
+                    self.connection = None
+                time.sleep(History.retry_delay)
+
+        while True:
+            try:
+                samples = self.queue.get(timeout=60)
+            except queue.Empty:
+                samples = None
+
+            try:
+                if samples is not None:
+                    self.insert(samples)
+
+                now = time.time()
+                if now - self.last_rollup >= 60:
+                    self.last_rollup = now
+                    self.rollup(now)
+                    self.expire(now)
+            except sqlite3.Error as e:
+                logging.error(e)
+                logging.error(traceback.format_exc())
+
+    def query(self, key: str, start: float, end: float, resolution: float = 0):
+        table = History.tiers[0][0]
+        for tier, size in History.tiers:
+            if size <= resolution:
+                table = tier
+
+        connection = self.connect()
+        try:
+            row = connection.execute(
+                "SELECT id FROM series WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return []
+            columns = "t, value" if table == "samples" else "t, min, mean, max, count"
+            return connection.execute(
+                "SELECT "
+                + columns
+                + " FROM "
+                + table
+                + " WHERE series = ? AND t >= ? AND t < ? ORDER BY t",
+                (row[0], start, end),
+            ).fetchall()
+        finally:
+            connection.close()
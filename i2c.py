@@ -3,6 +3,7 @@ import smbus2
 
 class I2C:
     buses: dict = {}
+    busio: dict = {}
 
     @staticmethod
     def get_bus(nr) -> smbus2.SMBus:
@@ -10,6 +11,19 @@ class I2C:
             I2C.buses[nr] = smbus2.SMBus(nr)
         return I2C.buses[nr]
 
+    @staticmethod
+    def get_busio(nr):
+        if nr not in I2C.busio:
+            if nr == 1:
+                import board
+
+                I2C.busio[nr] = board.I2C()
+            else:
+                from adafruit_extended_bus import ExtendedI2C
+
+                I2C.busio[nr] = ExtendedI2C(nr)
+        return I2C.busio[nr]
+
     @staticmethod
     def close_all():
         for nr in I2C.buses:
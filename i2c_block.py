@@ -0,0 +1,148 @@
+import struct
+import time
+
+from smbus2 import i2c_msg
+
+from i2c import I2C
+from metrics import Metrics
+
+
+class I2CBlockReader:
+    max_block_size = 32
+
+    def __init__(self, bus_nr: int, address: int, window: float):
+        self.bus_nr = bus_nr
+        self.address = address
+        self.window = window
+        self.registrations = {}
+        self.spans = ()
+        self.base = 0
+        self.size = 0
+        self.last_read = None
+        self.last_data = None
+        self.consumers = set()
+
+    def register(self, owner, spans: list):
+        self.registrations[owner] = spans
+        self.plan()
+
+    def unregister(self, owner):
+        self.registrations.pop(owner, None)
+        self.plan()
+
+    def plan(self):
+        spans = []
+        for start, end in sorted(
+            span for owner_spans in self.registrations.values() for span in owner_spans
+        ):
+            if spans and start <= spans[-1][1]:
+                spans[-1] = (spans[-1][0], max(spans[-1][1], end))
+            else:
+                spans.append((start, end))
+
+        self.spans = tuple(spans)
+        self.base = spans[0][0] if spans else 0
+        self.size = spans[-1][1] - self.base if spans else 0
+        self.last_read = None
+        self.last_data = None
+        self.consumers = set()
+
+    def read(self, owner) -> bytearray:
+        now = time.monotonic()
+        # Share a block read with the other owners, but never hand one owner the
+        # same data twice so fast sensors always get a fresh read
+        if (
+            self.last_read is not None
+            and now - self.last_read < self.window
+            and owner not in self.consumers
+        ):
+            self.consumers.add(owner)
+            return self.last_data
+
+        bus = I2C.get_bus(self.bus_nr)
+        data = bytearray(self.size)
+        if len(self.spans) == 1 and self.size <= I2CBlockReader.max_block_size:
+            data[:] = bytes(bus.read_i2c_block_data(self.address, self.base, self.size))
+        else:
+            messages = []
+            for start, end in self.spans:
+                messages.append(i2c_msg.write(self.address, [start]))
+                messages.append(i2c_msg.read(self.address, end - start))
+            bus.i2c_rdwr(*messages)
+            for (start, end), message in zip(self.spans, messages[1::2]):
+                data[start - self.base : end - self.base] = bytes(message)
+
+        Metrics.increment("i2c_transactions_total", bus=str(self.bus_nr))
+        Metrics.increment("i2c_bytes_total", self.size, bus=str(self.bus_nr))
+
+        self.last_read = now
+        self.last_data = data
+        self.consumers = {owner}
+        return data
+
+
+class I2CDecoder:
+    types = {
+        "uint8": "B",
+        "int8": "b",
+        "uint16": "H",
+        "int16": "h",
+        "uint32": "I",
+        "int32": "i",
+        "uint64": "Q",
+        "int64": "q",
+        "float32": "f",
+        "float64": "d",
+    }
+
+    unsigned = {1: "B", 2: "H", 4: "I", 8: "Q"}
+
+    endians = {"big": ">", "little": "<"}
+
+    def __init__(self, readouts: tuple, base: int):
+        self.base = base
+        self.readouts = tuple(sorted(readouts, key=lambda r: r.register))
+        self.struct = None
+        self.offset = 0
+        self.fields = []
+
+        position = None
+        endians = set()
+        format_string = ""
+        for readout in self.readouts:
+            offset = readout.register - base
+            field = None
+            if readout.data_type is not None:
+                field = struct.Struct(readout.endian + readout.data_type)
+            self.fields.append((field, offset, readout.length, readout.endian))
+
+            if position is None:
+                position = self.offset = offset
+            if readout.data_type is None or offset < position:
+                format_string = None
+            elif format_string is not None:
+                if offset > position:
+                    format_string += str(offset - position) + "x"
+                format_string += readout.data_type
+                position = offset + readout.length
+            endians.add(readout.endian)
+
+        if format_string and len(endians) == 1:
+            self.struct = struct.Struct(endians.pop() + format_string)
+
+    def decode(self, data) -> tuple:
+        if self.struct is not None:
+            return self.struct.unpack_from(data, self.offset)
+
+        values = []
+        for field, offset, length, endian in self.fields:
+            if field is not None:
+                values.append(field.unpack_from(data, offset)[0])
+            else:
+                values.append(
+                    int.from_bytes(
+                        data[offset : offset + length],
+                        "big" if endian == ">" else "little",
+                    )
+                )
+        return tuple(values)
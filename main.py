@@ -1,4 +1,8 @@
 #!/usr/bin/python3
+import time
+
+started = time.perf_counter()
+
 import logging
 from sensormonitor import SensorMonitor
 import os
@@ -12,13 +16,18 @@ logging.basicConfig(
     datefmt="%Y-%m-%d %H:%M:%S%z",
 )
 
-logging.info("Starting SensorMonitor")
-
+# Worker processes of the multiprocess engine import this module as well
+if __name__ == "__main__":
+    logging.info(
+        "Starting SensorMonitor, imports took "
+        + str(round(time.perf_counter() - started, 3))
+        + "s"
+    )
 
-try:
-    SensorMonitor.run()
-except Exception as e:
-    logging.error(type(e))
-    logging.error(e)
-    logging.error(traceback.format_exc())
-    raise
+    try:
+        SensorMonitor.run()
+    except Exception as e:
+        logging.error(type(e))
+        logging.error(e)
+        logging.error(traceback.format_exc())
+        raise
@@ -0,0 +1,176 @@
+import bisect
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Metrics:
+    lock = threading.Lock()
+    gauges: dict = {}
+    counters: dict = {}
+    histograms: dict = {}
+    collectors: list = []
+    server: ThreadingHTTPServer = None
+
+    buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    @staticmethod
+    def key(name, labels: dict):
+        return name, tuple(sorted(labels.items()))
+
+    @staticmethod
+    def set_gauge(name, value, **labels):
+        with Metrics.lock:
+            Metrics.gauges[Metrics.key(name, labels)] = value
+
+    @staticmethod
+    def get_gauge(name, default=None, **labels):
+        return Metrics.gauges.get(Metrics.key(name, labels), default)
+
+    @staticmethod
+    def increment(name, amount=1, **labels):
+        key = Metrics.key(name, labels)
+        with Metrics.lock:
+            Metrics.counters[key] = Metrics.counters.get(key, 0) + amount
+
+    @staticmethod
+    def get_counter(name, **labels):
+        return Metrics.counters.get(Metrics.key(name, labels), 0)
+
+    @staticmethod
+    def observe(name, value, **labels):
+        key = Metrics.key(name, labels)
+        with Metrics.lock:
+            histogram = Metrics.histograms.get(key)
+            if histogram is None:
+                histogram = Metrics.histograms[key] = [
+                    [0] * len(Metrics.buckets),
+                    0.0,
+                    0,
+                ]
+            i = bisect.bisect_left(Metrics.buckets, value)
+            if i < len(Metrics.buckets):
+                histogram[0][i] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    @staticmethod
+    def add_collector(collector):
+        Metrics.collectors.append(collector)
+
+    @staticmethod
+    def collect():
+        for collector in Metrics.collectors:
+            try:
+                collector()
+            except Exception as e:
+                logging.error("Metrics collector failed: " + str(e))
+
+    @staticmethod
+    def format_labels(labels: tuple, extra: tuple = ()) -> str:
+        labels = labels + extra
+        if not labels:
+            return ""
+        return (
+            "{"
+            + ",".join(
+                key
+                + '="'
+                + str(value).replace("\\", "\\\\").replace('"', '\\"')
+                + '"'
+                for key, value in labels
+            )
+            + "}"
+        )
+
+    @staticmethod
+    def render() -> str:
+        Metrics.collect()
+        lines = []
+        with Metrics.lock:
+            for kind, values in (
+                ("gauge", Metrics.gauges),
+                ("counter", Metrics.counters),
+            ):
+                names = set()
+                for (name, labels), value in sorted(values.items(), key=str):
+                    if name not in names:
+                        names.add(name)
+                        lines.append("# TYPE " + name + " " + kind)
+                    lines.append(
+                        name + Metrics.format_labels(labels) + " " + str(value)
+                    )
+
+            names = set()
+            histograms = sorted(Metrics.histograms.items(), key=str)
+            for (name, labels), histogram in histograms:
+                if name not in names:
+                    names.add(name)
+                    lines.append("# TYPE " + name + " histogram")
+                counts, total, count = histogram
+                cumulative = 0
+                for bound, bucket in zip(Metrics.buckets, counts):
+                    cumulative += bucket
+                    lines.append(
+                        name
+                        + "_bucket"
+                        + Metrics.format_labels(labels, (("le", bound),))
+                        + " "
+                        + str(cumulative)
+                    )
+                lines.append(
+                    name
+                    + "_bucket"
+                    + Metrics.format_labels(labels, (("le", "+Inf"),))
+                    + " "
+                    + str(count)
+                )
+                lines.append(
+                    name + "_sum" + Metrics.format_labels(labels) + " " + str(total)
+                )
+                lines.append(
+                    name + "_count" + Metrics.format_labels(labels) + " " + str(count)
+                )
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def summary() -> str:
+        Metrics.collect()
+        result = {}
+        with Metrics.lock:
+            for values in (Metrics.gauges, Metrics.counters):
+                for (name, labels), value in values.items():
+                    result[name + Metrics.format_labels(labels)] = value
+            for (name, labels), (counts, total, count) in Metrics.histograms.items():
+                result[name + "_avg" + Metrics.format_labels(labels)] = (
+                    total / count if count else None
+                )
+                result[name + "_count" + Metrics.format_labels(labels)] = count
+        return json.dumps(result, sort_keys=True)
+
+    @staticmethod
+    def serve(address: str, port: int):
+        Metrics.server = ThreadingHTTPServer((address, port), MetricsHandler)
+        Metrics.server.daemon_threads = True
+        threading.Thread(
+            target=Metrics.server.serve_forever, name="metrics", daemon=True
+        ).start()
+        logging.info("Serving metrics on " + address + ":" + str(port) + "/metrics")
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+
+        body = Metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,110 @@
+import logging
+import os
+import time
+
+from paho.mqtt import client as mqtt_client
+from paho.mqtt.client import MQTT_ERR_SUCCESS
+
+from config import Config
+from metrics import Metrics
+
+
+class MqttPublisher:
+    client: mqtt_client.Client = None
+
+    @staticmethod
+    def get_client():
+        if MqttPublisher.client is not None:
+            return MqttPublisher.client
+
+        client_id = "sensormonitor-mqtt-" + os.uname()[1] + "-" + str(os.getpid())
+        client = mqtt_client.Client(client_id)
+        client.username_pw_set(Config.get("MQTT.Username"), Config.get("MQTT.Password"))
+        client.on_connect = MqttPublisher.on_connect
+        client.on_disconnect = MqttPublisher.on_disconnect
+        client.reconnect_delay_set(1, 120)
+
+        started = time.perf_counter()
+        try:
+            client.connect(Config.get("MQTT.Broker"), Config.get("MQTT.Port", 1883))
+        except OSError as e:
+            Metrics.increment("mqtt_connect_errors_total", type=type(e).__name__)
+            logging.error("Could not connect to MQTT broker: " + str(e))
+            return None
+        finally:
+            Metrics.observe("mqtt_connect_seconds", time.perf_counter() - started)
+
+        client.loop_start()
+        MqttPublisher.client = client
+        return client
+
+    @staticmethod
+    def reset():
+        client = MqttPublisher.client
+        MqttPublisher.client = None
+        if client is not None:
+            logging.info("Disconnecting from MQTT broker")
+            client.loop_stop()
+            client.disconnect()
+
+    @staticmethod
+    def is_connected() -> bool:
+        client = MqttPublisher.get_client()
+        return client is not None and client.is_connected()
+
+    # noinspection PyUnusedLocal
+    @staticmethod
+    def on_connect(client, userdata, flags, rc):
+        if rc == 0:
+            logging.info("Connected to MQTT broker!")
+        else:
+            logging.error("Failed to connect to MQTT broker, return code %d", rc)
+
+    # noinspection PyUnusedLocal
+    @staticmethod
+    def on_disconnect(client, userdata, rc):
+        if rc != 0:
+            logging.error("Lost connection to MQTT broker, return code %d", rc)
+
+    @staticmethod
+    def publish(messages: list) -> list:
+        client = MqttPublisher.get_client()
+        if client is None:
+            return messages
+
+        qos = Config.get("MQTT.QoS", 0)
+        retain = Config.get("MQTT.Retain", False)
+
+        failed = []
+        pending = []
+        for topic, message in messages:
+            info = client.publish(topic, message, qos=qos, retain=retain)
+            if info.rc != MQTT_ERR_SUCCESS:
+                failed.append((topic, message))
+            else:
+                pending.append((topic, message, info))
+
+        deadline = time.monotonic() + Config.get_interval(
+            str(Config.get("MQTT.PublishTimeout", "10s"))
+        )
+        for topic, message, info in pending:
+            try:
+                info.wait_for_publish(max(0.0, deadline - time.monotonic()))
+            except (RuntimeError, ValueError) as e:
+                logging.error("MQTT publishing error for " + topic + ": " + str(e))
+            if not info.is_published():
+                failed.append((topic, message))
+
+        Metrics.increment(
+            "mqtt_messages_total", len(messages) - len(failed), result="sent"
+        )
+        if failed:
+            Metrics.increment("mqtt_messages_total", len(failed), result="failed")
+            logging.error(
+                "Failed to send "
+                + str(len(failed))
+                + " of "
+                + str(len(messages))
+                + " mqtt messages"
+            )
+        return failed
@@ -0,0 +1,152 @@
+import cProfile
+import contextlib
+import logging
+import os
+import signal
+import threading
+import time
+import tracemalloc
+
+from config import Config
+
+
+class ProfileSection:
+    def __init__(self, until: float):
+        self.until = until
+        self.profile = None
+
+    def __enter__(self):
+        name = threading.current_thread().name
+        with Profiler.lock:
+            if time.monotonic() < self.until:
+                self.profile = Profiler.profiles.get(name)
+                if self.profile is None:
+                    self.profile = Profiler.profiles[name] = cProfile.Profile()
+                try:
+                    self.profile.enable()
+                    Profiler.active.add(name)
+                except ValueError:
+                    self.profile = None
+        if self.profile is None:
+            Profiler.finish()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.profile is None:
+            return False
+
+        with Profiler.lock:
+            self.profile.disable()
+            Profiler.active.discard(threading.current_thread().name)
+        if time.monotonic() >= self.until:
+            Profiler.finish()
+        return False
+
+
+class Profiler:
+    lock = threading.Lock()
+    profile_until: float = None
+    profiles: dict = {}
+    active: set = set()
+    snapshot: tracemalloc.Snapshot = None
+    disabled = contextlib.nullcontext()
+
+    @staticmethod
+    def get_directory() -> str:
+        return Config.get("Profiling.Directory", os.path.dirname(__file__))
+
+    @staticmethod
+    def install():
+        signal.signal(signal.SIGUSR1, Profiler.on_signal)
+        signal.signal(signal.SIGUSR2, Profiler.on_signal)
+
+    # noinspection PyUnusedLocal
+    @staticmethod
+    def on_signal(signum, frame):
+        if signum == signal.SIGUSR1:
+            Profiler.start_profile()
+        elif signum == signal.SIGUSR2:
+            Profiler.toggle_tracemalloc()
+
+    @staticmethod
+    def check_triggers():
+        Profiler.finish()
+        directory = Profiler.get_directory()
+        for name, action in (
+            ("profile.trigger", Profiler.start_profile),
+            ("tracemalloc.trigger", Profiler.toggle_tracemalloc),
+        ):
+            path = os.path.join(directory, name)
+            if os.path.exists(path):
+                os.remove(path)
+                action()
+
+    @staticmethod
+    def section():
+        until = Profiler.profile_until
+        if until is None:
+            return Profiler.disabled
+        return ProfileSection(until)
+
+    @staticmethod
+    def start_profile():
+        if Profiler.profile_until is not None:
+            logging.info("Profiling already running")
+            return
+
+        duration = Config.parse_time(str(Config.get("Profiling.Duration", "30s")))
+        logging.info("Profiling for " + str(duration) + "s")
+        Profiler.profile_until = time.monotonic() + duration
+
+    @staticmethod
+    def finish():
+        until = Profiler.profile_until
+        if until is None or time.monotonic() < until:
+            return
+
+        # Profiles of threads that are not inside a section can be written from
+        # here, the others are written when their section exits
+        with Profiler.lock:
+            names = [name for name in Profiler.profiles if name not in Profiler.active]
+            if not Profiler.profiles:
+                Profiler.profile_until = None
+        for name in names:
+            Profiler.dump(name)
+
+    @staticmethod
+    def dump(name: str):
+        with Profiler.lock:
+            profile = Profiler.profiles.pop(name, None)
+            if not Profiler.profiles:
+                Profiler.profile_until = None
+        if profile is None:
+            return
+
+        path = os.path.join(
+            Profiler.get_directory(),
+            "profile-" + name + "-" + time.strftime("%Y%m%d-%H%M%S") + ".pstats",
+        )
+        profile.dump_stats(path)
+        logging.info("Wrote profile " + path)
+
+    @staticmethod
+    def toggle_tracemalloc():
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(Config.get("Profiling.Frames", 10))
+            Profiler.snapshot = tracemalloc.take_snapshot()
+            logging.info("Started tracemalloc")
+            return
+
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        statistics = snapshot.compare_to(Profiler.snapshot, "lineno")
+        Profiler.snapshot = None
+
+        path = os.path.join(
+            Profiler.get_directory(),
+            "tracemalloc-" + time.strftime("%Y%m%d-%H%M%S") + ".txt",
+        )
+        with open(path, "w") as file:
+            for statistic in statistics[: Config.get("Profiling.Top", 50)]:
+                file.write(str(statistic) + "\n")
+        logging.info("Wrote tracemalloc diff " + path)
@@ -0,0 +1,25 @@
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Optional
+
+
+@dataclass(frozen=True, eq=False)
+class Readout:
+    key: Optional[str]
+    register: Optional[int]
+    length: Optional[int]
+    data_type: Optional[str]
+    endian: Optional[str]
+    scale: float
+    offset: float
+    index: Optional[str]
+    series_key: str
+    topic: str
+    precision: int
+    deadband: Optional[float]
+    deadband_relative: bool
+    max_silence: Optional[float]
+    aggregate: tuple
+    filters: tuple
+    template: MappingProxyType
+
@@ -0,0 +1,50 @@
+from array import array
+
+from aggregator import Aggregator
+from readout import Readout
+
+
+class RingBuffer:
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise Exception("Ring buffer capacity must be positive")
+        self.capacity = capacity
+        self.times = array("d")
+        self.values = array("d")
+        self.next = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.times)
+
+    def append(self, t: float, value: float):
+        if len(self.times) < self.capacity:
+            self.times.append(t)
+            self.values.append(value)
+            return
+
+        self.times[self.next] = t
+        self.values[self.next] = value
+        self.next = (self.next + 1) % self.capacity
+        self.dropped += 1
+
+    def get_times(self) -> array:
+        return self.times[self.next :] + self.times[: self.next]
+
+    def get_values(self) -> array:
+        return self.values[self.next :] + self.values[: self.next]
+
+    def items(self):
+        return zip(self.get_times(), self.get_values())
+
+
+class Series:
+    def __init__(self, readout: Readout, capacity: int):
+        self.readout = readout
+        self.buffer = RingBuffer(capacity) if capacity > 0 else None
+        self.aggregator = Aggregator(readout.aggregate)
+
+    def append(self, t: float, value: float):
+        if self.buffer is not None:
+            self.buffer.append(t, value)
+        self.aggregator.add(value)
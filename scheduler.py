@@ -0,0 +1,82 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from metrics import Metrics
+
+
+class Scheduler:
+    def __init__(self):
+        self.queue = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.current = None
+        self.removed = set()
+
+    def add(self, sensor, due=None):
+        if due is None:
+            due = time.monotonic()
+        with self.condition:
+            heapq.heappush(self.queue, (due, next(self.counter), sensor))
+            self.condition.notify_all()
+
+    def remove(self, sensor):
+        with self.condition:
+            self.queue = [entry for entry in self.queue if entry[2] is not sensor]
+            heapq.heapify(self.queue)
+            if self.current is sensor:
+                self.removed.add(sensor)
+                while self.current is sensor:
+                    self.condition.wait()
+
+    def __len__(self):
+        return len(self.queue)
+
+    def wait_next(self):
+        with self.condition:
+            while True:
+                if not self.queue:
+                    self.condition.wait()
+                    continue
+                delay = self.queue[0][0] - time.monotonic()
+                if delay <= 0:
+                    due, _, sensor = heapq.heappop(self.queue)
+                    self.current = sensor
+                    return due, sensor
+                self.condition.wait(delay)
+
+    @staticmethod
+    def get_next_due(sensor, due, now):
+        next_due = due + sensor.interval
+        if sensor.retry_at is not None:
+            next_due = min(next_due, max(sensor.retry_at, now))
+            sensor.retry_at = None
+        elif next_due < now:
+            Metrics.increment("scheduler_overruns_total", sensor=sensor.label)
+            logging.info(
+                "Sensor "
+                + sensor.label
+                + " overran its interval by "
+                + str(round(now - next_due, 3))
+                + "s"
+            )
+            next_due = now
+        return next_due
+
+    def reschedule(self, sensor, due):
+        next_due = Scheduler.get_next_due(sensor, due, time.monotonic())
+        with self.condition:
+            self.current = None
+            if sensor in self.removed:
+                self.removed.discard(sensor)
+            else:
+                heapq.heappush(self.queue, (next_due, next(self.counter), sensor))
+            self.condition.notify_all()
+
+    def run(self, callback):
+        while True:
+            due, sensor = self.wait_next()
+            callback(sensor)
+            self.reschedule(sensor, due)
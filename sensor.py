@@ -1,311 +1,520 @@
-import datetime
+import importlib
 import logging
+import math
 import random
+import re
+import struct
 import time
 import traceback
+from types import MappingProxyType
 
+from aggregator import Aggregator
 from config import Config
-from i2c import I2C
+from device_registry import DeviceRegistry
+from filters import Filters
+from i2c_block import I2CBlockReader, I2CDecoder
+from metrics import Metrics
+from readout import Readout
 
 # noinspection PyUnresolvedReferences
 import RPi.GPIO as GPIO
 
 from sensor_abstract import AbstractSensor
-from sensor_ahtx0 import SensorAhtx0
-from sensor_gme680 import SensorGme680
-from sensor_htu31d import SensorHtu31d
-from sensor_sgp30 import SensorSgp30
-from sensor_shtc3 import SensorShtc3
-from sensor_scd30 import SensorScd30
 
 
 class Sensor(AbstractSensor):
-    devices = {}
-
-    def __init__(self, config: dict):
-        super().__init__(config)
+    local_backends = ("random",)
+
+    device_classes = {
+        "sgp30": "sensor_sgp30:SensorSgp30",
+        "htu31d": "sensor_htu31d:SensorHtu31d",
+        "shtc3": "sensor_shtc3:SensorShtc3",
+        "ahtx0": "sensor_ahtx0:SensorAhtx0",
+        "gme680": "sensor_gme680:SensorGme680",
+        "scd30": "sensor_scd30:SensorScd30",
+    }
+    loaded_classes: dict = {}
+    device_settings = (
+        "GPIO.Power",
+        "RebootInterval",
+        "SGP30.BootDelay",
+        "SCD30.MeasurementInterval",
+    )
+
+    default_addresses = {
+        "sgp30": 0x58,
+        "htu31d": 0x40,
+        "shtc3": 0x70,
+        "ahtx0": 0x38,
+        "gme680": 0x77,
+        "scd30": 0x61,
+    }
+
+    index_keys = {
+        "sgp30": "SGP30",
+        "htu31d": "HTU31D",
+        "shtc3": "SHTC3",
+        "ahtx0": "AHTx0",
+        "gme680": "GME680",
+        "scd30": "SCD30",
+    }
+
+    index_values = {
+        "sgp30": ("equivalent_co2", "total_voc"),
+        "htu31d": ("temperature", "relative_humidity"),
+        "shtc3": ("temperature", "relative_humidity"),
+        "ahtx0": ("temperature", "relative_humidity"),
+        "gme680": ("temperature", "relative_humidity"),
+        "scd30": ("co2", "temperature", "humidity"),
+    }
+
+    def __init__(self, config: dict, power_cycle=True):
+        super().__init__(config, power_cycle)
         self.last_value = None
-        self.last_read = 0
-        self.sgp30 = None
-        self.values = {}
+        self.handle = None
+        self.decoder = None
+        self.readouts = None
+        self.i2c_bus = None
+        self.i2c_address = None
+        self.interval = None
+        self.bus = None
+        self.retry_at = None
+        self.label = None
+        self.backend_name = None
+        self.reader = None
+        self.adaptive = False
+        self.min_interval = None
+        self.max_interval = None
+        self.growth = None
+        self.thresholds = None
+        self.previous_values = {}
+        self.last_read_time = None
+        self.sample_rate = None
+        self.filters = None
         self.validate_config()
 
-    def get_htu31d(self):
-        if "htu31d" not in self.devices:
-            self.devices["htu31d"] = SensorHtu31d(self.config)
-        return self.devices["htu31d"]
-
-    def get_sgp30(self):
-        i2c_address = self._get_i2c_address()
-        if "sgp30" + i2c_address not in Sensor.devices:
-            Sensor.devices["sgp30" + i2c_address] = SensorSgp30(self.config)
-        return Sensor.devices["sgp30" + i2c_address]
-
-    def get_shtc3(self):
-        if "shtc3" not in self.devices:
-            self.devices["shtc3"] = SensorShtc3(self.config)
-        return self.devices["shtc3"]
-
-    def get_ahtx0(self):
-        if "ahtx0" not in self.devices:
-            self.devices["ahtx0"] = SensorAhtx0(self.config)
-        return self.devices["ahtx0"]
-
-    def get_gme680(self):
-        if "gme680" not in self.devices:
-            self.devices["gme680"] = SensorGme680(self.config)
-        return self.devices["gme680"]
-
-    def get_scd30(self):
-        if "scd30" not in self.devices:
-            self.devices["scd30"] = SensorScd30(self.config)
-        return self.devices["scd30"]
+    @staticmethod
+    def get_device_class(backend: str):
+        if backend not in Sensor.loaded_classes:
+            module_name, class_name = Sensor.device_classes[backend].split(":")
+            started = time.perf_counter()
+            module = importlib.import_module(module_name)
+            duration = time.perf_counter() - started
+            Metrics.set_gauge("backend_import_seconds", duration, backend=backend)
+            logging.info(
+                "Imported " + module_name + " in " + str(round(duration, 3)) + "s"
+            )
+            Sensor.loaded_classes[backend] = getattr(module, class_name)
+        return Sensor.loaded_classes[backend]
+
+    def get_device_key(self) -> tuple:
+        return (
+            self.backend,
+            self._get_i2c_bus(),
+            self._get_i2c_address(Sensor.default_addresses[self.backend]),
+        )
+
+    def acquire_device(self):
+        if self.backend == "i2c":
+            window = Config.parse_time(str(Config.get("I2C.CoalesceWindow", "50ms")))
+            self.handle = DeviceRegistry.acquire(
+                ("i2c", self.i2c_bus, self.i2c_address),
+                lambda: I2CBlockReader(self.i2c_bus, self.i2c_address, window),
+            )
+            with self.handle.lock:
+                self.handle.device.register(
+                    self, [(r.register, r.register + r.length) for r in self.readouts]
+                )
+            return
+
+        if self.backend not in Sensor.device_classes:
+            return
+        device_class = Sensor.get_device_class(self.backend)
+        self.handle = DeviceRegistry.acquire(
+            self.get_device_key(), lambda: device_class(self.config)
+        )
+
+    def get_stale_device_settings(self) -> list:
+        if self.handle is None or self.backend_name not in Sensor.device_classes:
+            return []
+        device = self.handle.device
+        return [
+            key
+            for key in Sensor.device_settings
+            if device.get_config(key) != self.get_config(key)
+        ]
+
+    def release_device(self):
+        if self.handle is not None:
+            if self.backend == "i2c":
+                with self.handle.lock:
+                    self.handle.device.unregister(self)
+            DeviceRegistry.release(self.handle)
+            self.handle = None
 
     def validate_config(self):
         if not self.backend:
             raise Exception("Sensor setup incomplete - Backend must be set!")
 
-    def get_i2c_block_size(self):
-        t = 0
+    def compile(self):
+        index_key = Sensor.index_keys.get(self.backend)
+        readouts = []
         for readout_key in self.get_readout_keys():
-            register = self.get_config("I2C.Register", 1000, readout_key)
-            length = self.get_config("I2C.Length", 1000, readout_key)
-            t = max(t, register + length)
-        return t
+            index = None
+            if index_key is not None:
+                index = self.get_config(index_key + ".Index", readout_key=readout_key)
+                if index is None:
+                    raise Exception(
+                        index_key
+                        + ".Index not defined for readout "
+                        + str(readout_key)
+                        + "!"
+                    )
+                if index not in Sensor.index_values[self.backend]:
+                    raise Exception(
+                        "Invalid "
+                        + index_key
+                        + ".Index for readout "
+                        + str(readout_key)
+                        + "!"
+                    )
+
+            register = None
+            length = None
+            data_type = None
+            endian = None
+            if self.backend == "i2c":
+                register = self.get_config("I2C.Register", 0, readout_key)
+                length = self.get_config("I2C.Length", None, readout_key)
+                data_type, endian = self.compile_i2c_type(readout_key, length)
+                if data_type is not None:
+                    length = struct.calcsize(data_type)
+                if length is None:
+                    raise Exception(
+                        "I2C.Length not defined for readout " + str(readout_key) + "!"
+                    )
+
+            aggregate = self.get_config("Aggregate", ["mean"], readout_key)
+            if isinstance(aggregate, str):
+                aggregate = [aggregate]
+            aggregate = tuple(str(reducer) for reducer in aggregate)
+            Aggregator.validate(aggregate)
+            filters = Filters.compile(self.get_config("Filters", [], readout_key))
+
+            deadband, deadband_relative = self.compile_deadband(readout_key)
+            max_silence = self.get_config("MaxSilence", None, readout_key)
+            if max_silence is not None:
+                max_silence = Config.parse_time(str(max_silence))
+
+            template = self.get_result_template(readout_key)
+            readouts.append(
+                Readout(
+                    key=readout_key,
+                    register=register,
+                    length=length,
+                    data_type=data_type,
+                    endian=endian,
+                    scale=self.get_config("Scale", 1, readout_key),
+                    offset=self.get_config("Offset", 0, readout_key),
+                    index=index,
+                    series_key=template["group"] + "/" + template["name"],
+                    topic=template["topic"],
+                    precision=template["precision"],
+                    deadband=deadband,
+                    deadband_relative=deadband_relative,
+                    max_silence=max_silence,
+                    aggregate=aggregate,
+                    filters=filters,
+                    template=MappingProxyType(template),
+                )
+            )
+        self.readouts = tuple(readouts)
+        self.filters = {
+            readout: Filters.create(readout.filters)
+            for readout in self.readouts
+            if readout.filters
+        }
+        self.backend_name = self.backend
+        self.label = str(self.name or self.backend_name)
+        readers = {
+            "i2c": self.__read_i2c,
+            "sgp30": self.__read_sgp30,
+            "shtc3": self.__read_shtc3,
+            "gme680": self.__read_gme680,
+            "htu31d": self.__read_htu31d,
+            "ahtx0": self.__read_ahtx0,
+            "scd30": self.__read_scd30,
+            "random": self.__read_random,
+        }
+        if self.backend_name not in readers:
+            raise Exception("Sensor type undefined")
+        self.reader = readers[self.backend_name]
+        self.interval = Config.get_interval(str(self.get_config("Interval", "1s")))
+        self.compile_adaptive()
+        if self.backend not in Sensor.local_backends:
+            self.bus = self._get_i2c_bus()
+
+        if self.backend == "i2c":
+            self.i2c_bus = self._get_i2c_bus()
+            self.i2c_address = self._get_i2c_address()
+            if self.i2c_address is None:
+                raise Exception("I2C address not defined")
+
+    def compile_adaptive(self):
+        self.adaptive = self.get_config("Adaptive") is not None
+        if not self.adaptive:
+            return
+
+        self.min_interval = Config.get_interval(
+            str(self.get_config("Adaptive.MinInterval", self.interval))
+        )
+        self.max_interval = Config.get_interval(
+            str(self.get_config("Adaptive.MaxInterval", self.interval))
+        )
+        if not 0 < self.min_interval <= self.max_interval:
+            raise Exception("Invalid Adaptive interval bounds for " + self.label + "!")
+        self.growth = float(self.get_config("Adaptive.Growth", 1.5))
+        self.thresholds = {}
+        for readout in self.readouts:
+            threshold = self.get_config("Adaptive.Threshold", None, readout.key)
+            if threshold is None or float(threshold) <= 0:
+                raise Exception(
+                    "Adaptive.Threshold must be positive for "
+                    + str(readout.key or self.label)
+                    + "!"
+                )
+            self.thresholds[readout] = float(threshold)
+        self.interval = min(self.max_interval, max(self.min_interval, self.interval))
+
+    def adapt(self, data):
+        moving = False
+        for readout, t, value in data:
+            previous = self.previous_values.get(readout)
+            self.previous_values[readout] = (t, value)
+            if previous is None or t <= previous[0]:
+                continue
+            # Compare the slope so the decision does not depend on the interval
+            slope = abs(value - previous[1]) / (t - previous[0])
+            if slope > self.thresholds[readout]:
+                moving = True
+
+        # Jump to the fastest rate on a change and back off slowly while stable
+        if moving:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.max_interval, self.interval * self.growth)
+
+    def reject_non_finite(self, data):
+        result = []
+        for readout, t, value in data:
+            if math.isfinite(value):
+                result.append((readout, t, value))
+            else:
+                self.record_error(
+                    ValueError("Non-finite value for " + readout.series_key)
+                )
+        return result
+
+    def filter(self, data):
+        result = []
+        for readout, t, value in data:
+            filters = self.filters.get(readout)
+            if filters is not None:
+                for f in filters:
+                    value = f.apply(value)
+                    if value is None:
+                        Metrics.increment(
+                            "filter_rejected_total",
+                            sensor=self.label,
+                            readout=readout.series_key,
+                            filter=f.name,
+                        )
+                        break
+                if value is None:
+                    continue
+            result.append((readout, t, value))
+        return result
+
+    def record_rate(self, t: float):
+        if self.last_read_time is not None and t > self.last_read_time:
+            rate = 1 / (t - self.last_read_time)
+            if self.sample_rate is not None:
+                rate = self.sample_rate + 0.2 * (rate - self.sample_rate)
+            self.sample_rate = rate
+        self.last_read_time = t
+
+    def compile_deadband(self, readout_key):
+        deadband = self.get_config("Deadband", None, readout_key)
+        if deadband is None:
+            return None, False
+
+        match = re.fullmatch(r"(\d+(\.\d+)?)(%?)", str(deadband))
+        if match is None:
+            raise Exception("Invalid Deadband for readout " + str(readout_key) + "!")
+        return float(match.group(1)), match.group(3) == "%"
+
+    def compile_i2c_type(self, readout_key, length):
+        endian = self.get_config("I2C.Endian", "big", readout_key)
+        if endian not in I2CDecoder.endians:
+            raise Exception("Invalid I2C.Endian for readout " + str(readout_key) + "!")
+        endian = I2CDecoder.endians[endian]
+
+        name = self.get_config("I2C.Type", None, readout_key)
+        if name is None:
+            return I2CDecoder.unsigned.get(length), endian
+
+        if name not in I2CDecoder.types:
+            raise Exception("Invalid I2C.Type for readout " + str(readout_key) + "!")
+        return I2CDecoder.types[name], endian
 
     def __read_i2c(self):
-        bus_nr = self._get_i2c_bus()
-        address = self._get_i2c_address()
-
-        if address is None:
-            raise Exception("I2C address not defined")
-
-        bus = I2C.get_bus(bus_nr)
-
+        reader = self.handle.device
         try:
-            data: list = bus.read_i2c_block_data(address, 0, self.get_i2c_block_size())
-        except IOError:
+            with self.handle.lock:
+                data = reader.read(self)
+                base = reader.base
+        except IOError as e:
+            self.record_error(e)
             return None
 
-        results = []
-        t = self.get_time()
-        for readout in self.get_readout_keys():
-            register = self.get_config("I2C.Register", 0, readout_key=readout)
-            length = self.get_config("I2C.Length", readout_key=readout)
-            scale = self.get_config("Scale", 1, readout)
-
-            _data = data[register : register + length]
-            value = 0
-            for entry in _data:
-                value = value << 8 | entry
+        decoder = self.decoder
+        if decoder is None or decoder.base != base:
+            decoder = self.decoder = I2CDecoder(self.readouts, base)
 
-            _result = self.get_result_template(readout)
-            _result["values"][t] = value / scale + self.get_config("Offset", 0, readout)
-            results.append(_result)
-        return results
+        t = self.get_time()
+        return [
+            (readout, t, value / readout.scale + readout.offset)
+            for readout, value in zip(decoder.readouts, decoder.decode(data))
+        ]
 
     def __read_sgp30(self):
         try:
-            value = self.get_sgp30().read()
-        except IOError:
+            with self.handle.lock:
+                value = self.handle.device.read()
+        except IOError as e:
+            self.record_error(e)
             return None
 
-        results = []
+        if value is None:
+            return None
 
+        values = {
+            "equivalent_co2": value.equivalent_co2,
+            "total_voc": value.total_voc,
+        }
         t = self.get_time()
-
-        for key in self.get_readout_keys():
-            index = self.get_config("SGP30.Index", readout_key=key)
-            if index is None:
-                raise Exception("SGP30.Index not defined for readout " + key + "!")
-
-            if index == "equivalent_co2":
-                _value = value.equivalent_co2 + self.get_config("Offset", 0, key)
-            elif index == "total_voc":
-                _value = value.total_voc + self.get_config("Offset", 0, key)
-            else:
-                raise Exception("Invalid SGP30.Index for readout " + key + "!")
-
-            _result = self.get_result_template(key)
-            _result["values"][t] = _value
-            results.append(_result)
-
-        return results
+        return [
+            (readout, t, values[readout.index] + readout.offset)
+            for readout in self.readouts
+        ]
 
     def __read_htu31d(self):
         try:
-            temperature, relative_humidity = self.get_htu31d().read()
-        except IOError:
+            with self.handle.lock:
+                temperature, relative_humidity = self.handle.device.read()
+        except IOError as e:
+            self.record_error(e)
             return None
 
-        results = []
-
+        values = {"temperature": temperature, "relative_humidity": relative_humidity}
         t = self.get_time()
-
-        for key in self.get_readout_keys():
-            index = self.get_config("HTU31D.Index", readout_key=key)
-            if index is None:
-                raise Exception("HTU31D.Index not defined for readout " + key + "!")
-
-            if index == "temperature":
-                _value = temperature + self.get_config("Offset", 0, key)
-            elif index == "relative_humidity":
-                _value = relative_humidity + self.get_config("Offset", 0, key)
-            else:
-                raise Exception("Invalid HTU31D.Index for readout " + key + "!")
-
-            _result = self.get_result_template(key)
-            _result["values"][t] = _value
-            results.append(_result)
-
-        return results
+        return [
+            (readout, t, values[readout.index] + readout.offset)
+            for readout in self.readouts
+        ]
 
     def __read_shtc3(self):
         try:
-            temperature, relative_humidity = self.get_shtc3().read()
+            with self.handle.lock:
+                temperature, relative_humidity = self.handle.device.read()
         except IOError as e:
             logging.error(e)
+            self.record_error(e)
             return None
 
-        results = []
-
+        values = {"temperature": temperature, "relative_humidity": relative_humidity}
         t = self.get_time()
-
-        for key in self.get_readout_keys():
-            index = self.get_config("SHTC3.Index", readout_key=key)
-            if index is None:
-                raise Exception("SHTC3.Index not defined for readout " + key + "!")
-
-            if index == "temperature":
-                _value = temperature + self.get_config("Offset", 0, key)
-            elif index == "relative_humidity":
-                _value = relative_humidity + self.get_config("Offset", 0, key)
-            else:
-                raise Exception("Invalid SHTC3.Index for readout " + key + "!")
-
-            _result = self.get_result_template(key)
-            _result["values"][t] = _value
-            results.append(_result)
-
-        return results
+        return [
+            (readout, t, values[readout.index] + readout.offset)
+            for readout in self.readouts
+        ]
 
     def __read_ahtx0(self):
-
-        results = []
-
+        device = self.handle.device
         t = self.get_time()
-
-        for key in self.get_readout_keys():
-            index = self.get_config("AHTx0.Index", readout_key=key)
-            if index is None:
-                logging.info(self.config)
-                raise Exception("AHTx0.Index not defined for readout " + key + "!")
-
-            _value = self.get_ahtx0().read(index) + self.get_config("Offset", 0, key)
-
-            _result = self.get_result_template(key)
-            _result["values"][t] = _value
-            results.append(_result)
-
-        return results
+        with self.handle.lock:
+            return [
+                (readout, t, device.read(readout.index) + readout.offset)
+                for readout in self.readouts
+            ]
 
     def __read_gme680(self):
-
-        results = []
-
+        device = self.handle.device
         t = self.get_time()
-
-        for key in self.get_readout_keys():
-            index = self.get_config("GME680.Index", readout_key=key)
-            if index is None:
-                logging.info(self.config)
-                raise Exception("GME680.Index not defined for readout " + key + "!")
-
-            _value = self.get_gme680().read(index) + self.get_config("Offset", 0, key)
-
-            _result = self.get_result_template(key)
-            _result["values"][t] = _value
-            results.append(_result)
-
-        return results
+        with self.handle.lock:
+            return [
+                (readout, t, device.read(readout.index) + readout.offset)
+                for readout in self.readouts
+            ]
 
     def __read_scd30(self):
+        device = self.handle.device
         try:
-            measurements = self.get_scd30().read()
-            if measurements is None:
-                return None
-            co2, temperature, relative_humidity = measurements
-        except IOError:
+            with self.handle.lock:
+                measurements = device.read()
+        except IOError as e:
+            self.record_error(e)
             return None
 
-        results = []
+        if measurements is None:
+            self.retry_at = device.get_next_data_time()
+            return None
+        co2, temperature, relative_humidity = measurements
 
+        values = {"co2": co2, "temperature": temperature, "humidity": relative_humidity}
         t = self.get_time()
+        return [
+            (readout, t, values[readout.index] + readout.offset)
+            for readout in self.readouts
+        ]
 
-        for key in self.get_readout_keys():
-            index = self.get_config("SCD30.Index", readout_key=key)
-            if index is None:
-                raise Exception("SCD30.Index not defined for readout " + key + "!")
-
-            if index == "temperature":
-                _value = temperature + self.get_config("Offset", 0, key)
-            elif index == "humidity":
-                _value = relative_humidity + self.get_config("Offset", 0, key)
-            elif index == "co2":
-                _value = co2 + self.get_config("Offset", 0, key)
-            else:
-                raise Exception("Invalid SCD30.Index for readout " + key + "!")
-
-            _result = self.get_result_template(key)
-            _result["values"][t] = _value
-            results.append(_result)
-
-        return results
-
-    def should_read_now(self):
-        return time.time() - self.last_read >= Config.get_interval(
-            self.get_config("Interval", "1s")
+    def __read_random(self):
+        t = self.get_time()
+        return [(readout, t, random.randint(0, 100)) for readout in self.readouts]
+
+    def record_error(self, e: Exception):
+        Metrics.increment(
+            "sensor_errors_total",
+            sensor=self.label,
+            backend=self.backend_name,
+            type=type(e).__name__,
         )
 
+    def read_backend(self):
+        self.last_value = self.reader()
+        return self.last_value
+
     def read(self):
+        started = time.perf_counter()
         try:
-            if self.backend == "i2c":
-                self.last_value = self.__read_i2c()
-                return self.last_value
-
-            if self.backend == "sgp30":
-                self.last_value = self.__read_sgp30()
-                return self.last_value
-
-            if self.backend == "shtc3":
-                self.last_value = self.__read_shtc3()
-                return self.last_value
-
-            if self.backend == "gme680":
-                self.last_value = self.__read_gme680()
-                return self.last_value
-
-            if self.backend == "htu31d":
-                self.last_value = self.__read_htu31d()
-                return self.last_value
-
-            if self.backend == "ahtx0":
-                self.last_value = self.__read_ahtx0()
-                return self.last_value
-
-            if self.backend == "scd30":
-                self.last_value = self.__read_scd30()
-                return self.last_value
-
-            if self.backend == "random":
-                t = datetime.datetime.fromtimestamp(time.time()).strftime(
-                    "%Y-%m-%d %H:%M:%S%z"
-                )
-                _result = self.get_result_template(None)
-                _result["values"][t] = random.randint(0, 100)
-                return [_result]
-
-            raise Exception("Sensor type undefined")
+            data = self.read_backend()
+            if data:
+                data = self.reject_non_finite(data)
+            if data and self.filters:
+                data = self.filter(data)
+            if data:
+                self.record_rate(data[0][1])
+                if self.adaptive:
+                    self.adapt(data)
+            return data
         except Exception as e:
+            self.record_error(e)
             logging.critical(e)
             logging.critical(traceback.format_exc())
+        finally:
+            Metrics.observe(
+                "sensor_read_seconds",
+                time.perf_counter() - started,
+                sensor=self.label,
+                backend=self.backend_name,
+            )
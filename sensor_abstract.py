@@ -1,4 +1,3 @@
-import datetime
 import time
 
 # noinspection PyUnresolvedReferences
@@ -8,8 +7,12 @@ from config import Config
 
 
 class AbstractSensor:
-    def __init__(self, config: dict):
+    def __init__(self, config: dict, power_cycle=True):
         self.config = config
+        if power_cycle:
+            self.power_cycle()
+
+    def power_cycle(self):
         pin = self.get_config("GPIO.Power", False)
         if pin:
             GPIO.setup(pin, GPIO.OUT)
@@ -58,10 +61,8 @@ class AbstractSensor:
         return self.get_config("I2C.Address", default)
 
     @staticmethod
-    def get_time():
-        return datetime.datetime.fromtimestamp(time.time()).strftime(
-            "%Y-%m-%d %H:%M:%S%z"
-        )
+    def get_time() -> float:
+        return time.time()
 
     def get_readout_keys(self):
         values = self.get_config("Readouts")
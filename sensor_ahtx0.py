@@ -2,8 +2,8 @@ import logging
 import time
 
 import adafruit_ahtx0
-import board
 
+from i2c import I2C
 from sensor_abstract import AbstractSensor
 
 # noinspection PyUnresolvedReferences
@@ -24,10 +24,10 @@ class SensorAhtx0(AbstractSensor):
                 GPIO.output(pin, GPIO.LOW)
                 time.sleep(0.2)
                 GPIO.output(pin, GPIO.HIGH)
-            i2c = board.I2C()
+            i2c = I2C.get_busio(self._get_i2c_bus())
             device = None
             try:
-                device = adafruit_ahtx0.AHTx0(i2c)
+                device = adafruit_ahtx0.AHTx0(i2c, address=self._get_i2c_address(0x38))
             except Exception as e:
                 logging.info(e)
             self.device = device
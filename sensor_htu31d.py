@@ -2,8 +2,8 @@ import logging
 import time
 
 import adafruit_htu31d
-import board
 
+from i2c import I2C
 from sensor_abstract import AbstractSensor
 
 # noinspection PyUnresolvedReferences
@@ -24,10 +24,12 @@ class SensorHtu31d(AbstractSensor):
                 GPIO.output(pin, GPIO.LOW)
                 time.sleep(0.2)
                 GPIO.output(pin, GPIO.HIGH)
-            i2c = board.I2C()
+            i2c = I2C.get_busio(self._get_i2c_bus())
             device = None
             try:
-                device = adafruit_htu31d.HTU31D(i2c)
+                device = adafruit_htu31d.HTU31D(
+                    i2c, address=self._get_i2c_address(0x40)
+                )
             except Exception as e:
                 logging.info(e)
             self.device = device
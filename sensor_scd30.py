@@ -1,6 +1,7 @@
 import logging
 import time
 
+from metrics import Metrics
 from sensor_abstract import AbstractSensor
 
 # noinspection PyUnresolvedReferences
@@ -11,8 +12,14 @@ import scd30_i2c
 class SensorScd30(AbstractSensor):
     device: scd30_i2c.SCD30 = None
 
+    poll_interval = 0.2
+    data_timeout = 5
+
     def __init__(self, config: dict):
         super().__init__(config)
+        self.bus = self._get_i2c_bus()
+        self.measurement_interval = self.get_config("SCD30.MeasurementInterval", 2)
+        self.last_data_time = None
 
     def __get_device(self) -> scd30_i2c.SCD30:
         if self.device is None:
@@ -25,22 +32,48 @@ class SensorScd30(AbstractSensor):
             device = None
             try:
                 device = scd30_i2c.SCD30()
-                device.set_measurement_interval(2)
+                device.set_measurement_interval(self.measurement_interval)
                 device.start_periodic_measurement()
             except Exception as e:
                 logging.info(e)
             self.device = device
+            self.last_data_time = time.monotonic()
 
         return self.device
 
+    def get_expected_data_time(self):
+        if self.last_data_time is None:
+            return None
+        return self.last_data_time + self.measurement_interval
+
+    def get_next_data_time(self):
+        expected = self.get_expected_data_time()
+        if expected is None:
+            return None
+
+        now = time.monotonic()
+        if expected > now:
+            return expected
+        if now - expected < self.data_timeout:
+            return now + self.poll_interval
+        return None
+
     def read(self, index=None):
         device = self.__get_device()
-        start_time = time.time()
-        while not device.get_data_ready() and time.time() - start_time < 5:
-            time.sleep(0.2)
         if not device.get_data_ready():
             return None
-        measurements = self.__get_device().read_measurement()
+
+        now = time.monotonic()
+        expected = self.get_expected_data_time()
+        if expected is not None:
+            Metrics.set_gauge(
+                "scd30_data_ready_latency_seconds",
+                max(0.0, now - expected),
+                bus=str(self.bus),
+            )
+        self.last_data_time = now
+
+        measurements = device.read_measurement()
         if measurements is None:
             return None
 
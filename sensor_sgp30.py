@@ -1,11 +1,15 @@
 import json
 import logging
 import os
+import threading
 import time
 
 import sgp30
+import smbus2
 
 from config import Config
+from i2c import I2C
+from metrics import Metrics
 from sensor_abstract import AbstractSensor
 
 # noinspection PyUnresolvedReferences
@@ -18,6 +22,16 @@ class SensorSgp30(AbstractSensor):
 
     def __init__(self, config: dict):
         super().__init__(config)
+        self.bus = self._get_i2c_bus()
+        self.address = self._get_i2c_address(0x58)
+        self.boot_thread = None
+        self.last_status = None
+        self.boot_delay = Config.parse_time(
+            str(self.get_config("SGP30.BootDelay", "10s"))
+        )
+        self.reboot_interval = self.get_config("RebootInterval", False)
+        if self.reboot_interval:
+            self.reboot_interval = Config.parse_time(str(self.reboot_interval))
 
     def __save_baseline(self):
         sensor = self.__get_device()
@@ -26,34 +40,65 @@ class SensorSgp30(AbstractSensor):
         json.dump({"co2": baseline.equivalent_co2, "voc": baseline.total_voc}, file)
         file.close()
 
+    @property
+    def warming_up(self) -> bool:
+        return self.boot_thread is not None and self.boot_thread.is_alive()
+
+    @property
+    def status(self) -> str:
+        if self.warming_up:
+            return "warming up"
+        if self.sgp30_device is None:
+            return "off"
+        return "ready"
+
     def __get_device(self) -> sgp30.SGP30:
+        if self.warming_up:
+            return None
+
         if self.sgp30_device is None:
-            try:
-                self.__boot_device()
-            except Exception as e:
-                logging.critical(e)
-            self.last_reboot = time.time()
-
-        reboot_interval = self.get_config("RebootInterval", False)
-        if reboot_interval:
-            reboot_interval = Config.parse_time(reboot_interval)
-            if time.time() - self.last_reboot >= reboot_interval:
-                self.last_reboot = time.time()
-                self.__reboot_device()
+            self.__start_background(self.__boot_device)
+            return None
+
+        if self.reboot_interval:
+            if time.time() - self.last_reboot >= self.reboot_interval:
+                self.__start_background(self.__reboot_device)
+                return None
 
         return self.sgp30_device
 
+    def __start_background(self, target):
+        self.last_reboot = time.time()
+        self.boot_thread = threading.Thread(
+            target=self.__run_background,
+            args=(target,),
+            name="sgp30-boot",
+            daemon=True,
+        )
+        self.boot_thread.start()
+
+    @staticmethod
+    def __run_background(target):
+        try:
+            target()
+        except Exception as e:
+            logging.critical(e)
+
     def __boot_device(self):
         logging.info("Starting SGP30 sensor")
         self.__power_on()
-        time.sleep(10)
-        self.sgp30_device = sgp30.SGP30(i2c_addr=self._get_i2c_address(0x58))
+        time.sleep(self.boot_delay)
+        device = sgp30.SGP30(
+            i2c_dev=I2C.get_bus(self.bus),
+            i2c_msg=smbus2.i2c_msg,
+            i2c_addr=self.address,
+        )
         logging.info("Warming up SGP30 sensor")
-        self.sgp30_device.start_measurement()
+        device.start_measurement()
 
-        if os.path.exists(self.__get_sgp30_baseline_file(self.sgp30_device)):
+        if os.path.exists(self.__get_sgp30_baseline_file(device)):
             logging.info("Loading baseline")
-            f = open(self.__get_sgp30_baseline_file(self.sgp30_device), "r")
+            f = open(self.__get_sgp30_baseline_file(device), "r")
             contents = f.read()
             f.close()
             bl = json.loads(contents)
@@ -68,9 +113,11 @@ class SensorSgp30(AbstractSensor):
                 logging.info(
                     "Setting baseline: " + str(bl["co2"]) + " / " + str(bl["voc"])
                 )
-                self.sgp30_device.set_baseline(bl["co2"], bl["voc"])
+                device.set_baseline(bl["co2"], bl["voc"])
 
-        return self.sgp30_device
+        self.sgp30_device = device
+        logging.info("SGP30 sensor ready")
+        return device
 
     @staticmethod
     def __get_sgp30_baseline_file(sensor: sgp30.SGP30) -> str:
@@ -93,10 +140,19 @@ class SensorSgp30(AbstractSensor):
         logging.info("Rebooting " + self.backend)
         self.__power_off()
         time.sleep(1)
-        self.__get_device()
-
-    def __read(self):
-        return self.__get_device().get_air_quality()
+        self.__boot_device()
 
     def read(self):
-        return self.__get_device().get_air_quality()
+        device = self.__get_device()
+        status = self.status
+        if status != self.last_status:
+            logging.info("SGP30 at " + hex(self.address) + " is " + status)
+            self.last_status = status
+        Metrics.set_gauge(
+            "sgp30_warming_up",
+            int(device is None),
+            address=str(self.address),
+        )
+        if device is None:
+            return None
+        return device.get_air_quality()
@@ -2,8 +2,8 @@ import logging
 import time
 
 import adafruit_shtc3
-import board
 
+from i2c import I2C
 from sensor_abstract import AbstractSensor
 
 # noinspection PyUnresolvedReferences
@@ -24,7 +24,7 @@ class SensorShtc3(AbstractSensor):
                 GPIO.output(pin, GPIO.LOW)
                 time.sleep(0.2)
                 GPIO.output(pin, GPIO.HIGH)
-            i2c = board.I2C()
+            i2c = I2C.get_busio(self._get_i2c_bus())
             device = None
             try:
                 device = adafruit_shtc3.SHTC3(i2c)
@@ -1,31 +1,49 @@
+import asyncio
 import errno
+import gzip
 import json
 import logging
 import os
-import statistics
+import queue
+import random
+import resource
+import signal
 import threading
 import time
 import traceback
 
 import requests
-from paho.mqtt import client as mqtt_client
-from paho.mqtt.client import MQTT_ERR_SUCCESS
 
 from config import Config
+from history import History
+from metrics import Metrics
+from mqtt_publisher import MqttPublisher
+from profiler import Profiler
+from ring_buffer import Series
+from scheduler import Scheduler
 from sensor import Sensor
+from spool import Spool
 
 
 class SensorMonitor:
-    mqtt_client = None
     latest_data = None
     sensors = None
+    buffer_size: int = None
+    spool: Spool = None
+    history: History = None
+    schedulers: dict = None
+    worker_threads: list = None
+    config_modified: float = None
 
     lock = None
 
+    last_sent: dict = {}
+
     sender_session: requests.Session = None
+    http_queue: queue.Queue = None
 
     @staticmethod
-    def send_data(data, url=None) -> bool:
+    def send_data(data, url=None):
         if SensorMonitor.sender_session is None:
             SensorMonitor.sender_session = requests.Session()
 
@@ -35,7 +53,7 @@ class SensorMonitor:
             url = Config.get("Server.Address")
 
         if url is None:
-            return False
+            return None
 
         auth = None
 
@@ -48,14 +66,20 @@ class SensorMonitor:
                 Config.get("Server.Password", None),
             )
 
-        headers = Config.get("Server.Headers")
+        headers = {"Content-Type": "application/json"}
+        headers.update(Config.get("Server.Headers", {}))
+
+        body = json.dumps(data, separators=(",", ":")).encode("utf-8")
+        if Config.get("Server.Gzip", False):
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
 
         try:
-            response = session.post(url=url, json=data, auth=auth, headers=headers)
+            response = session.post(url=url, data=body, auth=auth, headers=headers)
         except requests.exceptions.RequestException as e:
             logging.error("Exception while trying to send data")
             logging.error(e)
-            return False
+            return None
 
         if response.status_code < 200 or response.status_code > 299:
             logging.error(
@@ -64,120 +88,426 @@ class SensorMonitor:
                 + " with body: "
                 + response.text
             )
-            return False
+
+        return response.status_code
+
+    @staticmethod
+    def is_retryable(status) -> bool:
+        return status is None or status == 429 or status >= 500
+
+    @staticmethod
+    def send_data_with_retries(data) -> bool:
+        retries = Config.get("Server.Retries", 5)
+        backoff = Config.get_interval(str(Config.get("Server.Backoff", "1s")))
+        max_backoff = Config.get_interval(str(Config.get("Server.MaxBackoff", "60s")))
+
+        for attempt in range(retries + 1):
+            status = SensorMonitor.send_data(data)
+            if status is not None and 200 <= status <= 299:
+                return True
+            if not SensorMonitor.is_retryable(status):
+                return False
+            if attempt < retries:
+                time.sleep(random.uniform(0, min(max_backoff, backoff * 2**attempt)))
+
+        return False
+
+    @staticmethod
+    def queue_http_data(entries):
+        if SensorMonitor.http_queue is None:
+            return
+
+        t = time.time()
+        readouts = []
+        for key in entries:
+            series = entries[key]
+            aggregates = SensorMonitor.get_aggregates(series)
+            if aggregates:
+                readout = dict(series.readout.template)
+                readout["time"] = t
+                readout["values"] = dict(aggregates)
+                readouts.append(readout)
+
+        if not readouts:
+            return
+
         try:
-            json.loads(response.text)
-        except ValueError:
-            logging.error("Response could not be decoded: " + response.text)
-            return False
+            SensorMonitor.http_queue.put_nowait(readouts)
+        except queue.Full:
+            logging.error(
+                "HTTP queue is full, dropping " + str(len(readouts)) + " readouts"
+            )
+
+    @staticmethod
+    def send_http_batch():
+        readouts = SensorMonitor.http_queue.get()
+        while True:
+            try:
+                readouts += SensorMonitor.http_queue.get_nowait()
+            except queue.Empty:
+                break
 
-        return True
+        max_batch_size = Config.get("Server.MaxBatchSize", 500)
+        for start in range(0, len(readouts), max_batch_size):
+            batch = readouts[start : start + max_batch_size]
+            data = {"host": os.uname()[1], "time": time.time(), "readouts": batch}
+            if not SensorMonitor.send_data_with_retries(data):
+                logging.error("Dropping " + str(len(batch)) + " readouts for HTTP push")
 
     @staticmethod
-    def aggregate_data(data, decimals):
-        value = round(statistics.mean(data), decimals)
+    def send_http_loop():
+        while True:
+            try:
+                SensorMonitor.send_http_batch()
+            except Exception as e:
+                logging.error(e)
+                logging.error(traceback.format_exc())
+
+    @staticmethod
+    def round_value(value, decimals):
+        value = round(value, decimals)
         if decimals == 0:
             value = int(value)
         return value
 
+    @staticmethod
+    def get_aggregates(series: Series):
+        readout = series.readout
+        results = []
+        if series.aggregator.count == 0:
+            return results
+
+        for reducer in readout.aggregate:
+            value = series.aggregator.get(reducer)
+            if reducer != "count":
+                value = SensorMonitor.round_value(value, readout.precision)
+            results.append((reducer, value))
+        return results
+
+    @staticmethod
+    def is_changed(readout, value, now) -> bool:
+        last = SensorMonitor.last_sent.get(readout)
+        if last is None:
+            return True
+
+        last_value, last_time = last
+        if readout.max_silence is not None and now - last_time >= readout.max_silence:
+            return True
+
+        deadband = readout.deadband or 0
+        if readout.deadband_relative:
+            deadband = abs(last_value) * deadband / 100
+        return abs(value - last_value) > deadband
+
+    @staticmethod
+    def aggregate_data(series: Series, now=None):
+        readout = series.readout
+        results = []
+        aggregates = SensorMonitor.get_aggregates(series)
+        if aggregates and (
+            readout.deadband is not None or readout.max_silence is not None
+        ):
+            if now is None:
+                now = time.monotonic()
+            value = aggregates[0][1]
+            if not SensorMonitor.is_changed(readout, value, now):
+                Metrics.increment("mqtt_suppressed_total", len(aggregates))
+                return results
+            SensorMonitor.last_sent[readout] = (value, now)
+
+        for i, (reducer, value) in enumerate(aggregates):
+            topic = readout.topic if i == 0 else readout.topic + "/" + reducer
+            results.append((topic, str(value)))
+        return results
+
     @staticmethod
     def send_aggregated_data_mqtt(entries):
-        client = SensorMonitor.get_mqtt_client()
-        if client is None:
-            return False
+        started = time.perf_counter()
+        try:
+            return SensorMonitor.publish_entries(entries)
+        finally:
+            Metrics.observe("mqtt_send_seconds", time.perf_counter() - started)
 
+    @staticmethod
+    def publish_entries(entries):
+        messages = []
+        readouts = {}
+        now = time.monotonic()
         for key in entries:
-            entry = entries[key]
+            series = entries[key]
+            for message in SensorMonitor.aggregate_data(series, now):
+                messages.append(message)
+                readouts[message[0]] = series.readout
+
+        topic = Config.get("Metrics.Topic")
+        if topic is not None:
+            messages.append((topic, Metrics.summary()))
+
+        spool = SensorMonitor.spool
+        if spool is None:
+            failed = MqttPublisher.publish(messages)
+            # Unsent values have to be published again even if they did not change
+            for topic, message in failed:
+                SensorMonitor.last_sent.pop(readouts.get(topic), None)
+            return not failed
+
+        if len(spool) and MqttPublisher.is_connected():
+            spool.replay(MqttPublisher.publish)
+
+        if len(spool):
+            spool.append(messages)
+            return False
 
-            if "precision" in entry:
-                precision = entry["precision"]
-            else:
-                precision = 0
+        failed = MqttPublisher.publish(messages)
+        spool.append(failed)
+        return not failed
 
-            topic = entry["topic"]
-            message = str(
-                SensorMonitor.aggregate_data(entry["values"].values(), precision)
-            )
-            if client is None:
-                logging.error("MQTT client is none!")
-            result = client.publish(topic, message)
-            status = result[0]
-            if status != 0:
-                logging.error("Failed to send mqtt message for " + topic)
-            result = client.loop()
-
-            if result != MQTT_ERR_SUCCESS:
-                logging.error("MQTT publishing error: " + str(result))
-                SensorMonitor.mqtt_client = None
-
-    @staticmethod
-    def get_mqtt_client():
-        client = SensorMonitor.mqtt_client
-
-        if isinstance(client, mqtt_client.Client) and client.is_connected():
-            can_loop = SensorMonitor.mqtt_client.loop()
-            if can_loop != MQTT_ERR_SUCCESS:
-                logging.error("MQTT looping error: " + str(can_loop))
-                client = None
-
-        if client is None:
-            client_id = "sensormonitor-mqtt-" + os.uname()[1] + "-"
-            os.getpid()
-            client = mqtt_client.Client(client_id)
-            SensorMonitor.mqtt_client = client
-
-        if isinstance(client, mqtt_client.Client) and not client.is_connected():
-            broker = Config.get("MQTT.Broker")
-            port = Config.get("MQTT.Port", 1883)
-            username = Config.get("MQTT.Username")
-            password = Config.get("MQTT.Password")
-            client.username_pw_set(username, password)
-            client.on_connect = SensorMonitor.on_mqtt_connect
-            client.connect(broker, port)
-
-        return SensorMonitor.mqtt_client
-
-    # noinspection PyUnusedLocal
-    @staticmethod
-    def on_mqtt_connect(client, userdata, flags, rc):
-        if rc == 0:
-            logging.info("Connected to MQTT broker!")
-        else:
-            logging.error("Failed to connect to MQTT broker, return code %d\n", rc)
-            SensorMonitor.mqtt_client = None
+    @staticmethod
+    def setup_spool():
+        if Config.get("Spool") is None:
+            return
+
+        SensorMonitor.spool = Spool(
+            Config.get("Spool.Directory", os.path.dirname(__file__) + "/spool"),
+            Config.parse_size(Config.get("Spool.MaxSize", "50M")),
+            Config.parse_size(Config.get("Spool.SegmentSize", "1M")),
+        )
+
+    @staticmethod
+    def setup_history():
+        if Config.get("History") is None:
+            return
+
+        retention = {}
+        for table, key in (
+            ("samples", "Raw"),
+            ("rollup_minute", "Minute"),
+            ("rollup_hour", "Hour"),
+            ("rollup_day", "Day"),
+        ):
+            value = Config.get("History.Retention." + key)
+            if value is not None:
+                retention[table] = Config.parse_time(str(value))
+
+        SensorMonitor.history = History(
+            Config.get("History.File", os.path.dirname(__file__) + "/history.sqlite"),
+            retention,
+            Config.get_interval() + 60,
+            Config.get("History.MaxQueue", 100),
+        )
+        SensorMonitor.history.start()
+
+    @staticmethod
+    def setup_metrics():
+        Metrics.add_collector(SensorMonitor.collect_metrics)
+        port = Config.get("Metrics.Port")
+        if port is not None:
+            Metrics.serve(Config.get("Metrics.Address", "127.0.0.1"), port)
 
     @staticmethod
-    def read_sensors():
-        data = []
+    def collect_metrics():
+        Metrics.set_gauge("latest_data_series", len(SensorMonitor.latest_data))
         for sensor in SensorMonitor.sensors:
-            if not sensor.should_read_now():
-                continue
+            if sensor.sample_rate is not None:
+                Metrics.set_gauge(
+                    "sensor_sample_rate_hz", sensor.sample_rate, sensor=sensor.label
+                )
+            if sensor.adaptive:
+                Metrics.set_gauge(
+                    "sensor_interval_seconds", sensor.interval, sensor=sensor.label
+                )
+        if SensorMonitor.schedulers is not None:
+            for bus, scheduler in SensorMonitor.schedulers.items():
+                Metrics.set_gauge("scheduler_queue_depth", len(scheduler), bus=str(bus))
+        if SensorMonitor.http_queue is not None:
+            Metrics.set_gauge("http_queue_depth", SensorMonitor.http_queue.qsize())
+        if SensorMonitor.history is not None:
+            Metrics.set_gauge(
+                "history_queue_depth", SensorMonitor.history.queue.qsize()
+            )
+        if SensorMonitor.spool is not None:
+            Metrics.set_gauge("spool_segments", len(SensorMonitor.spool))
 
-            value = sensor.read()
-            if value is None:
-                continue
+    @staticmethod
+    def read_sensor(sensor):
+        with Profiler.section():
+            data = sensor.read()
+            if data is None:
+                return None
 
-            data += value
+            SensorMonitor.store_data(data)
+            return data
 
+    @staticmethod
+    def store_data(data):
         with SensorMonitor.lock:
-            for entry in data:
-                key = entry["group"] + "/" + entry["name"]
-                if key not in SensorMonitor.latest_data:
-                    SensorMonitor.latest_data[key] = entry
-                else:
-                    for t in entry["values"]:
-                        SensorMonitor.latest_data[key]["values"][t] = entry["values"][t]
+            for readout, t, value in data:
+                series = SensorMonitor.latest_data.get(readout.series_key)
+                if series is None:
+                    series = Series(readout, SensorMonitor.buffer_size)
+                    SensorMonitor.latest_data[readout.series_key] = series
+                series.append(t, value)
 
-        return data
+    @staticmethod
+    def get_sensor_configs() -> list:
+        return [
+            data
+            for data in Config.get("Sensors", [])
+            if Config.get("Active", True, data)
+        ]
 
     @staticmethod
-    def setup_sensors():
+    def setup_sensors(acquire=True):
+        SensorMonitor.buffer_size = Config.get("BufferSize", 3600)
+        SensorMonitor.config_modified = Config.get_modified_time()
         SensorMonitor.sensors = []
         for data in Config.get("Sensors"):
-            sensor = Sensor(data)
+            sensor = Sensor(data, acquire)
             if sensor.get_config("Active", True):
+                sensor.compile()
+                if acquire:
+                    sensor.acquire_device()
                 SensorMonitor.sensors.append(sensor)
 
+    @staticmethod
+    def get_sensor_key(config: dict) -> str:
+        return json.dumps(config, sort_keys=True, default=str)
+
+    @staticmethod
+    def update_sensors():
+        previous = {}
+        for sensor in SensorMonitor.sensors:
+            key = SensorMonitor.get_sensor_key(sensor.config)
+            previous.setdefault(key, []).append(sensor)
+
+        sensors = []
+        added = []
+        try:
+            for data in SensorMonitor.get_sensor_configs():
+                unchanged = previous.get(SensorMonitor.get_sensor_key(data))
+                if unchanged:
+                    sensors.append(unchanged.pop(0))
+                    continue
+
+                sensor = Sensor(data, power_cycle=False)
+                sensor.compile()
+                sensor.acquire_device()
+                added.append(sensor)
+                sensors.append(sensor)
+                # A device that is still shared with the old sensor keeps its wrapper
+                stale = sensor.get_stale_device_settings()
+                if stale:
+                    logging.info(
+                        "Changes to "
+                        + ", ".join(stale)
+                        + " of "
+                        + sensor.label
+                        + " take effect after a restart"
+                    )
+                # Device wrappers power cycle themselves when they are created
+                if sensor.backend not in Sensor.device_classes and (
+                    sensor.handle is None or sensor.handle.references == 1
+                ):
+                    sensor.power_cycle()
+        except Exception:
+            for sensor in added:
+                sensor.release_device()
+            raise
+
+        SensorMonitor.sensors = sensors
+        removed = [sensor for group in previous.values() for sensor in group]
+        return added, removed
+
+    @staticmethod
+    def reload_config():
+        modified = Config.get_modified_time()
+        if modified is None or modified == SensorMonitor.config_modified:
+            return None
+        SensorMonitor.config_modified = modified
+
+        logging.info("Reloading configuration from " + Config.config_file)
+        try:
+            previous = Config.reload()
+        except Exception as e:
+            logging.error("Could not load configuration: " + str(e))
+            return None
+
+        try:
+            added, removed = SensorMonitor.update_sensors()
+        except Exception as e:
+            Config.data = previous
+            logging.error("Could not apply configuration: " + str(e))
+            logging.error(traceback.format_exc())
+            return None
+
+        SensorMonitor.buffer_size = Config.get("BufferSize", 3600)
+        for sensor in removed:
+            for readout in sensor.readouts:
+                SensorMonitor.last_sent.pop(readout, None)
+        if Config.get("MQTT", data=previous) != Config.get("MQTT"):
+            MqttPublisher.reset()
+        for key in ("Engine", "Server", "Spool", "History", "Metrics", "ConfigReload"):
+            if Config.get(key, data=previous) != Config.get(key):
+                logging.info("Changes to " + key + " take effect after a restart")
+
+        logging.info(
+            "Reloaded configuration, added "
+            + str(len(added))
+            + " and removed "
+            + str(len(removed))
+            + " sensors"
+        )
+        return added, removed
+
+    @staticmethod
+    def get_reload_interval():
+        return Config.parse_time(str(Config.get("ConfigReload", "5s")))
+
+    @staticmethod
+    def watch_config_loop():
+        interval = SensorMonitor.get_reload_interval()
+        while True:
+            time.sleep(interval)
+            changes = SensorMonitor.reload_config()
+            if changes is not None:
+                added, removed = changes
+                SensorMonitor.remove_sensors(removed)
+                SensorMonitor.add_sensors(added)
+
+    @staticmethod
+    def start_workers():
+        SensorMonitor.schedulers = {}
+        SensorMonitor.worker_threads = []
+        SensorMonitor.add_sensors(SensorMonitor.sensors)
+
+    @staticmethod
+    def add_sensors(sensors):
+        now = time.monotonic()
+        started = []
+        for sensor in sensors:
+            if sensor.bus not in SensorMonitor.schedulers:
+                SensorMonitor.schedulers[sensor.bus] = Scheduler()
+                started.append(sensor.bus)
+            SensorMonitor.schedulers[sensor.bus].add(sensor, now)
+
+        for bus in started:
+            scheduler = SensorMonitor.schedulers[bus]
+            name = "local" if bus is None else "i2c-" + str(bus)
+            thread = threading.Thread(
+                target=scheduler.run, args=(SensorMonitor.read_sensor,), name=name
+            )
+            logging.info(
+                "Starting worker " + name + " with " + str(len(scheduler)) + " sensors"
+            )
+            thread.start()
+            SensorMonitor.worker_threads.append(thread)
+
+    @staticmethod
+    def remove_sensors(sensors):
+        for sensor in sensors:
+            SensorMonitor.schedulers[sensor.bus].remove(sensor)
+            sensor.release_device()
+
     @staticmethod
     def get_process_lock_file():
         return os.path.dirname(__file__) + "/.sensors.lock"
@@ -200,6 +530,25 @@ class SensorMonitor:
         else:
             return True
 
+    @staticmethod
+    def read_proc_file(pid, name) -> str:
+        procfile = f"/proc/{pid}/{name}"
+        if not os.path.exists(procfile):
+            return ""
+        try:
+            file = open(procfile, "r")
+            contents = file.read()
+            file.close()
+        except OSError:
+            return ""
+        return contents
+
+    @staticmethod
+    def is_monitor_process(pid) -> bool:
+        if not str(pid).isnumeric() or not SensorMonitor.pid_exists(int(pid)):
+            return False
+        return "main.py" in SensorMonitor.read_proc_file(pid, "cmdline")
+
     @staticmethod
     def is_already_running():
         filename = SensorMonitor.get_process_lock_file()
@@ -207,50 +556,93 @@ class SensorMonitor:
             return False
 
         file = open(filename, "r")
-        pid = file.read()
+        pids = file.read().split()
         file.close()
 
-        result = False
-        if pid.isnumeric():
-            procfile = f"/proc/{pid}/comm"
+        if pids and SensorMonitor.is_monitor_process(pids[0]):
+            return True
+
+        for worker in pids[1:]:
+            SensorMonitor.stop_stale_worker(worker)
+        os.remove(filename)
+        return False
 
-            if os.path.exists(procfile):
-                file = open(procfile, "r")
-                name = file.read()
-                file.close()
-                result = name == "main.py"
+    @staticmethod
+    def stop_stale_worker(pid):
+        if not pid.isnumeric() or not SensorMonitor.pid_exists(int(pid)):
+            return
+        if "multiprocessing" not in SensorMonitor.read_proc_file(pid, "cmdline"):
+            return
 
-        if not result:
-            os.remove(filename)
+        # Leave workers alone that still belong to a running monitor
+        stat = SensorMonitor.read_proc_file(pid, "stat")
+        fields = stat[stat.rfind(")") + 2 :].split()
+        if len(fields) > 1 and SensorMonitor.is_monitor_process(fields[1]):
+            return
 
-        return result
+        logging.info("Stopping stale worker process " + pid)
+        os.kill(int(pid), signal.SIGTERM)
 
     @staticmethod
-    def save_process_lock():
+    def save_process_lock(workers=()):
         logging.info("Saving process lock")
         file = open(SensorMonitor.get_process_lock_file(), "w")
-        file.write(str(os.getpid()))
+        file.write("\n".join(str(pid) for pid in (os.getpid(),) + tuple(workers)))
         file.close()
 
+    @staticmethod
+    def collect_entries():
+        with SensorMonitor.lock:
+            entries = SensorMonitor.latest_data
+            SensorMonitor.latest_data = {}
+        return entries
+
+    @staticmethod
+    def count_dropped(entries):
+        for key, series in entries.items():
+            if series.buffer is not None and series.buffer.dropped:
+                Metrics.increment(
+                    "buffer_dropped_total", series.buffer.dropped, series=key
+                )
+                logging.error(
+                    "Dropped "
+                    + str(series.buffer.dropped)
+                    + " raw samples of "
+                    + key
+                    + ", BufferSize is too small for the interval"
+                )
+
+    @staticmethod
+    def send_entries(entries):
+        Profiler.check_triggers()
+        SensorMonitor.count_dropped(entries)
+        sinks = [SensorMonitor.queue_http_data, SensorMonitor.send_aggregated_data_mqtt]
+        if SensorMonitor.history is not None:
+            sinks.insert(0, SensorMonitor.history.store)
+        with Profiler.section():
+            for sink in sinks:
+                try:
+                    sink(entries)
+                except Exception as e:
+                    logging.error(e)
+                    logging.error(traceback.format_exc())
+
     @staticmethod
     def send_data_loop():
         interval = Config.get_interval()
         while True:
             loop_started = time.time()
-
-            with SensorMonitor.lock:
-                entries = SensorMonitor.latest_data.copy()
-                SensorMonitor.latest_data = {}
-
             try:
-                SensorMonitor.send_aggregated_data_mqtt(entries)
+                interval = Config.get_interval()
+                SensorMonitor.send_entries(SensorMonitor.collect_entries())
             except Exception as e:
                 logging.error(e)
                 logging.error(traceback.format_exc())
-                pass
 
             sleep_time = max([0, interval - time.time() + loop_started])
-            if sleep_time < 0.7:
+            if sleep_time == 0:
+                Metrics.increment("sender_overruns_total")
+            if sleep_time < min(0.7, interval / 10):
                 logging.info("Sleeping for " + str(sleep_time))
             time.sleep(sleep_time)
 
@@ -260,24 +652,69 @@ class SensorMonitor:
             logging.info("Aborting startup due to existing process")
             return
 
+        engine = Config.get("Engine", "threaded")
+        if engine not in ("threaded", "asyncio", "multiprocess"):
+            raise Exception("Invalid engine: " + str(engine))
+
         SensorMonitor.save_process_lock()
         SensorMonitor.latest_data = {}
         SensorMonitor.lock = threading.Lock()
 
         logging.info("Starting sensors")
-        SensorMonitor.setup_sensors()
+        started = time.perf_counter()
+        SensorMonitor.setup_sensors(engine != "multiprocess")
+        duration = time.perf_counter() - started
+        Metrics.set_gauge("startup_seconds", duration)
+        logging.info(
+            "Set up "
+            + str(len(SensorMonitor.sensors))
+            + " sensors in "
+            + str(round(duration, 3))
+            + "s, max RSS "
+            + str(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024)
+            + " MB"
+        )
+        SensorMonitor.setup_spool()
+        SensorMonitor.setup_history()
+        SensorMonitor.setup_metrics()
+        Profiler.install()
+        if Config.get("Server.Address") is not None:
+            SensorMonitor.http_queue = queue.Queue(Config.get("Server.MaxQueue", 1000))
+
+        if engine == "asyncio":
+            from sensormonitor_async import AsyncSensorMonitor
+
+            logging.info("Starting asyncio engine")
+            asyncio.run(AsyncSensorMonitor.main())
+            return
+
+        SensorMonitor.start_senders()
+        if engine == "multiprocess":
+            from sensormonitor_process import ProcessSensorMonitor
+
+            logging.info("Starting worker processes")
+            ProcessSensorMonitor.run()
+            return
 
+        logging.info("Starting bus workers")
+        SensorMonitor.start_workers()
+        if SensorMonitor.get_reload_interval() > 0:
+            threading.Thread(
+                target=SensorMonitor.watch_config_loop, name="config", daemon=True
+            ).start()
+        for thread in SensorMonitor.worker_threads:
+            thread.join()
+
+    @staticmethod
+    def start_senders():
         logging.info("Starting sender thread")
         SensorMonitor.sender_thread = threading.Thread(
-            target=SensorMonitor.send_data_loop
+            target=SensorMonitor.send_data_loop, name="sender"
         )
         SensorMonitor.sender_thread.start()
-        logging.info("Started sender thread, proceeding to main loop")
-
-        while True:
-            loop_started = time.time()
-            SensorMonitor.read_sensors()
-            sleep_time = max([0, 1 - time.time() + loop_started])
-            if sleep_time < 0.7:
-                logging.info("Sleeping for " + str(sleep_time))
-            time.sleep(sleep_time)
+        if SensorMonitor.http_queue is not None:
+            logging.info("Starting HTTP sender thread")
+            SensorMonitor.http_thread = threading.Thread(
+                target=SensorMonitor.send_http_loop, name="http"
+            )
+            SensorMonitor.http_thread.start()
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config
+from metrics import Metrics
+from scheduler import Scheduler
+from sensormonitor import SensorMonitor
+
+
+class AsyncSensorMonitor:
+    executors: dict = None
+    sender_executor: ThreadPoolExecutor = None
+    sensor_tasks: dict = None
+
+    @staticmethod
+    def get_executor(bus) -> ThreadPoolExecutor:
+        if bus not in AsyncSensorMonitor.executors:
+            name = "local" if bus is None else "i2c-" + str(bus)
+            AsyncSensorMonitor.executors[bus] = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix=name
+            )
+        return AsyncSensorMonitor.executors[bus]
+
+    @staticmethod
+    async def sensor_task(sensor, due):
+        loop = asyncio.get_running_loop()
+        executor = AsyncSensorMonitor.get_executor(sensor.bus)
+        while True:
+            delay = due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await loop.run_in_executor(executor, SensorMonitor.read_sensor, sensor)
+            due = Scheduler.get_next_due(sensor, due, time.monotonic())
+
+    @staticmethod
+    def add_sensors(sensors):
+        now = time.monotonic()
+        for sensor in sensors:
+            AsyncSensorMonitor.get_executor(sensor.bus)
+            AsyncSensorMonitor.sensor_tasks[sensor] = asyncio.create_task(
+                AsyncSensorMonitor.sensor_task(sensor, now)
+            )
+
+    @staticmethod
+    async def remove_sensors(sensors):
+        loop = asyncio.get_running_loop()
+        for sensor in sensors:
+            AsyncSensorMonitor.sensor_tasks.pop(sensor).cancel()
+            # Queued behind a read that may still be running on the bus executor
+            await loop.run_in_executor(
+                AsyncSensorMonitor.get_executor(sensor.bus), sensor.release_device
+            )
+
+    @staticmethod
+    async def config_task(interval):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            changes = await loop.run_in_executor(None, SensorMonitor.reload_config)
+            if changes is not None:
+                added, removed = changes
+                await AsyncSensorMonitor.remove_sensors(removed)
+                AsyncSensorMonitor.add_sensors(added)
+
+    @staticmethod
+    async def mqtt_task():
+        loop = asyncio.get_running_loop()
+        interval = Config.get_interval()
+        due = time.monotonic() + interval
+        while True:
+            await asyncio.sleep(max(0.0, due - time.monotonic()))
+            try:
+                interval = Config.get_interval()
+                entries = SensorMonitor.collect_entries()
+                await loop.run_in_executor(
+                    AsyncSensorMonitor.sender_executor,
+                    SensorMonitor.send_entries,
+                    entries,
+                )
+            except Exception as e:
+                logging.error(e)
+                logging.error(traceback.format_exc())
+            due += interval
+            if due < time.monotonic():
+                Metrics.increment("sender_overruns_total")
+                logging.info("Sending overran the interval, skipping ahead")
+                due = time.monotonic()
+
+    @staticmethod
+    async def http_task():
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="http")
+        while True:
+            try:
+                await loop.run_in_executor(executor, SensorMonitor.send_http_batch)
+            except Exception as e:
+                logging.error(e)
+                logging.error(traceback.format_exc())
+
+    @staticmethod
+    async def main():
+        AsyncSensorMonitor.executors = {}
+        AsyncSensorMonitor.sender_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="sender"
+        )
+        AsyncSensorMonitor.sensor_tasks = {}
+
+        tasks = [asyncio.create_task(AsyncSensorMonitor.mqtt_task())]
+        if SensorMonitor.http_queue is not None:
+            tasks.append(asyncio.create_task(AsyncSensorMonitor.http_task()))
+        interval = SensorMonitor.get_reload_interval()
+        if interval > 0:
+            tasks.append(asyncio.create_task(AsyncSensorMonitor.config_task(interval)))
+        AsyncSensorMonitor.add_sensors(SensorMonitor.sensors)
+        logging.info(
+            "Started "
+            + str(len(SensorMonitor.sensors))
+            + " sensor tasks on "
+            + str(len(AsyncSensorMonitor.executors))
+            + " bus executors"
+        )
+
+        await asyncio.gather(*tasks)
@@ -0,0 +1,231 @@
+import atexit
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+import traceback
+
+from config import Config
+from metrics import Metrics
+from scheduler import Scheduler
+from sensor import Sensor
+from sensormonitor import SensorMonitor
+from shared_ring import SharedRing
+
+
+class ProcessWorker:
+    def __init__(self, name: str, sensors: list, ring: SharedRing):
+        self.name = name
+        self.sensors = sensors
+        self.ring = ring
+        self.process = None
+        self.started = None
+        self.restarts = 0
+        self.restart_at = None
+
+    def start(self):
+        # A worker that was killed while holding the ring lock never releases it
+        self.ring.lock = ProcessSensorMonitor.context.Lock()
+        self.process = ProcessSensorMonitor.context.Process(
+            target=ProcessSensorMonitor.worker,
+            args=(
+                Config.data,
+                self.name,
+                self.sensors,
+                self.ring.name,
+                self.ring.capacity,
+                self.ring.lock,
+                os.getpid(),
+            ),
+            name=self.name,
+            daemon=True,
+        )
+        self.process.start()
+        self.started = time.monotonic()
+        self.restart_at = None
+        logging.info(
+            "Started worker "
+            + self.name
+            + " with pid "
+            + str(self.process.pid)
+            + " for "
+            + str(len(self.sensors))
+            + " sensors"
+        )
+
+
+class ProcessSensorMonitor:
+    context = multiprocessing.get_context("spawn")
+    poll_interval = 0.1
+    workers: dict = None
+    lock = threading.Lock()
+    stopped = False
+
+    ring: SharedRing = None
+    positions: dict = None
+
+    @staticmethod
+    def worker(config, name, sensors, ring_name, ring_size, ring_lock, parent):
+        # Workers get the parent's config rather than reading the file again, so
+        # a restarted worker always matches the sensors the parent compiled
+        Config.data = config
+        threading.Thread(
+            target=ProcessSensorMonitor.watch_parent,
+            args=(parent,),
+            name="watchdog",
+            daemon=True,
+        ).start()
+
+        ProcessSensorMonitor.ring = SharedRing(ring_size, ring_lock, ring_name)
+        ProcessSensorMonitor.positions = {}
+        scheduler = Scheduler()
+        now = time.monotonic()
+        for index, sensor_config in sensors:
+            sensor = Sensor(sensor_config)
+            sensor.compile()
+            sensor.acquire_device()
+            for position, readout in enumerate(sensor.readouts):
+                ProcessSensorMonitor.positions[readout] = (index, position)
+            scheduler.add(sensor, now)
+
+        logging.info("Worker " + name + " running " + str(len(scheduler)) + " sensors")
+        scheduler.run(ProcessSensorMonitor.read_sensor)
+
+    @staticmethod
+    def watch_parent(parent):
+        while os.getppid() == parent:
+            time.sleep(1)
+        logging.error("Parent process exited, stopping worker")
+        os._exit(1)
+
+    @staticmethod
+    def read_sensor(sensor):
+        data = sensor.read()
+        if data is None:
+            return
+
+        for readout, t, value in data:
+            index, position = ProcessSensorMonitor.positions[readout]
+            ProcessSensorMonitor.ring.append(index, position, t, value)
+
+    @staticmethod
+    def read_rings():
+        while True:
+            with ProcessSensorMonitor.lock:
+                if ProcessSensorMonitor.stopped:
+                    return
+                for worker in ProcessSensorMonitor.workers.values():
+                    try:
+                        ProcessSensorMonitor.read_ring(worker)
+                    except Exception as e:
+                        logging.error(
+                            "Reading ring of " + worker.name + " failed: " + str(e)
+                        )
+                        logging.error(traceback.format_exc())
+            time.sleep(ProcessSensorMonitor.poll_interval)
+
+    @staticmethod
+    def read_ring(worker: ProcessWorker):
+        samples, dropped = worker.ring.read()
+        if dropped:
+            Metrics.increment("ring_dropped_total", dropped, worker=worker.name)
+            logging.error(
+                "Worker " + worker.name + " overran its ring by " + str(dropped)
+            )
+        if samples:
+            sensors = SensorMonitor.sensors
+            SensorMonitor.store_data(
+                [
+                    (sensors[index].readouts[position], t, value)
+                    for index, position, t, value in samples
+                ]
+            )
+
+    @staticmethod
+    def save_process_lock():
+        SensorMonitor.save_process_lock(
+            worker.process.pid for worker in ProcessSensorMonitor.workers.values()
+        )
+
+    @staticmethod
+    def supervise():
+        while True:
+            time.sleep(1)
+            now = time.monotonic()
+            for worker in ProcessSensorMonitor.workers.values():
+                if worker.process.is_alive():
+                    if worker.restarts and now - worker.started > 60:
+                        worker.restarts = 0
+                    continue
+
+                if worker.restart_at is None:
+                    delay = min(60, 2**worker.restarts)
+                    worker.restarts += 1
+                    worker.restart_at = now + delay
+                    Metrics.increment("worker_restarts_total", worker=worker.name)
+                    logging.error(
+                        "Worker "
+                        + worker.name
+                        + " exited with code "
+                        + str(worker.process.exitcode)
+                        + ", restarting in "
+                        + str(delay)
+                        + "s"
+                    )
+                elif now >= worker.restart_at:
+                    worker.start()
+                    ProcessSensorMonitor.save_process_lock()
+
+    @staticmethod
+    def stop():
+        # Runs from atexit and from the SIGTERM handler, the lock keeps the ring
+        # reader off the segments while they are unlinked
+        with ProcessSensorMonitor.lock:
+            if ProcessSensorMonitor.stopped:
+                return
+            ProcessSensorMonitor.stopped = True
+            for worker in ProcessSensorMonitor.workers.values():
+                if worker.process.is_alive():
+                    worker.process.terminate()
+                    worker.process.join(5)
+                worker.ring.unlink()
+                # Dropping the lock lets multiprocessing unlink its semaphore
+                worker.ring.lock = None
+
+    @staticmethod
+    def on_sigterm(signum, frame):
+        # atexit handlers do not run on a signal, which would leak the segments
+        logging.info("Received SIGTERM, stopping workers")
+        ProcessSensorMonitor.stop()
+        filename = SensorMonitor.get_process_lock_file()
+        if os.path.exists(filename):
+            os.remove(filename)
+        os._exit(0)
+
+    @staticmethod
+    def run():
+        if SensorMonitor.get_reload_interval() > 0:
+            logging.info("ConfigReload is not supported by the multiprocess engine")
+
+        ring_size = int(Config.get("Multiprocess.RingSize", 65536))
+        groups = {}
+        for index, sensor in enumerate(SensorMonitor.sensors):
+            groups.setdefault(sensor.bus, []).append((index, sensor.config))
+
+        ProcessSensorMonitor.workers = {}
+        atexit.register(ProcessSensorMonitor.stop)
+        signal.signal(signal.SIGTERM, ProcessSensorMonitor.on_sigterm)
+        for bus, sensors in groups.items():
+            name = "local" if bus is None else "i2c-" + str(bus)
+            ring = SharedRing(ring_size, ProcessSensorMonitor.context.Lock())
+            worker = ProcessWorker(name, sensors, ring)
+            ProcessSensorMonitor.workers[name] = worker
+            worker.start()
+        ProcessSensorMonitor.save_process_lock()
+
+        threading.Thread(
+            target=ProcessSensorMonitor.read_rings, name="rings", daemon=True
+        ).start()
+        ProcessSensorMonitor.supervise()
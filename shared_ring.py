@@ -0,0 +1,79 @@
+import struct
+from multiprocessing import shared_memory
+
+
+class SharedRing:
+    header = struct.Struct("<Q")
+    record = struct.Struct("<HH4xdd")
+    lock_timeout = 1
+
+    def __init__(self, capacity: int, lock, name: str = None):
+        self.capacity = capacity
+        # Shared memory has no ordering guarantees of its own; the lock is a
+        # semaphore, so taking it orders the writes for the other process
+        self.lock = lock
+        if name is None:
+            self.memory = shared_memory.SharedMemory(
+                create=True,
+                size=SharedRing.header.size + capacity * SharedRing.record.size,
+            )
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.buffer = self.memory.buf
+        self.count = SharedRing.header.unpack_from(self.buffer, 0)[0]
+        self.position = self.count
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    def get_offset(self, count: int) -> int:
+        return SharedRing.header.size + (count % self.capacity) * SharedRing.record.size
+
+    def append(self, sensor: int, readout: int, t: float, value: float):
+        with self.lock:
+            SharedRing.record.pack_into(
+                self.buffer, self.get_offset(self.count), sensor, readout, t, value
+            )
+            self.count += 1
+            SharedRing.header.pack_into(self.buffer, 0, self.count)
+
+    def read(self):
+        # The parent swaps in a new lock when a worker restarts
+        lock = self.lock
+        if not lock.acquire(timeout=SharedRing.lock_timeout):
+            return [], 0
+        try:
+            count = SharedRing.header.unpack_from(self.buffer, 0)[0]
+            dropped = 0
+            if count - self.position > self.capacity:
+                dropped = count - self.capacity - self.position
+                self.position = count - self.capacity
+
+            # Copy under the lock and unpack afterwards, the slots wrap around
+            # at most once
+            chunks = []
+            while self.position < count:
+                start = self.get_offset(self.position)
+                size = min(
+                    count - self.position, self.capacity - self.position % self.capacity
+                )
+                chunks.append(
+                    bytes(self.buffer[start : start + size * SharedRing.record.size])
+                )
+                self.position += size
+        finally:
+            lock.release()
+
+        samples = []
+        for chunk in chunks:
+            samples.extend(SharedRing.record.iter_unpack(chunk))
+        return samples, dropped
+
+    def close(self):
+        self.buffer.release()
+        self.memory.close()
+
+    def unlink(self):
+        self.close()
+        self.memory.unlink()
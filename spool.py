@@ -0,0 +1,126 @@
+import json
+import logging
+import os
+import threading
+import time
+
+
+class Spool:
+    def __init__(self, directory: str, max_size: int, segment_size: int):
+        self.directory = directory
+        self.max_size = max_size
+        self.segment_size = segment_size
+        self.lock = threading.Lock()
+        self.file = None
+        self.file_size = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self.segments = sorted(
+            os.path.join(directory, name)
+            for name in os.listdir(directory)
+            if name.endswith(".seg")
+        )
+        if self.segments:
+            logging.info(
+                "Found " + str(len(self.segments)) + " spool segments to replay"
+            )
+
+    def __len__(self):
+        return len(self.segments)
+
+    def __get_size(self) -> int:
+        size = 0
+        for path in self.segments:
+            try:
+                size += os.path.getsize(path)
+            except OSError:
+                pass
+        return size
+
+    def __open_segment(self):
+        number = 0
+        if self.segments:
+            number = int(os.path.basename(self.segments[-1]).split(".")[0]) + 1
+        path = os.path.join(self.directory, "%012d.seg" % number)
+        self.file = open(path, "ab", buffering=65536)
+        self.file_size = 0
+        self.segments.append(path)
+
+    def __close_segment(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __evict(self):
+        evicted = 0
+        while len(self.segments) > 1 and self.__get_size() > self.max_size:
+            if self.file is not None and self.segments[0] == self.file.name:
+                break
+            os.remove(self.segments.pop(0))
+            evicted += 1
+        if evicted:
+            logging.warning("Evicted " + str(evicted) + " spool segments")
+
+    def append(self, messages: list):
+        if not messages:
+            return
+
+        t = time.time()
+        data = b"".join(
+            json.dumps([t, topic, message]).encode("utf-8") + b"\n"
+            for topic, message in messages
+        )
+        with self.lock:
+            if self.file is None or self.file_size >= self.segment_size:
+                self.__close_segment()
+                self.__open_segment()
+            self.file.write(data)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file_size += len(data)
+            self.__evict()
+
+    @staticmethod
+    def __read_segment(path: str) -> list:
+        messages = []
+        with open(path, "rb") as file:
+            for line in file:
+                try:
+                    t, topic, message = json.loads(line)
+                except ValueError:
+                    continue
+                messages.append((topic, message))
+        return messages
+
+    @staticmethod
+    def __rewrite_segment(path: str, messages: list):
+        with open(path + ".tmp", "wb") as file:
+            for topic, message in messages:
+                file.write(json.dumps([0, topic, message]).encode("utf-8") + b"\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path + ".tmp", path)
+
+    def replay(self, publish, batch_size: int = 500) -> bool:
+        with self.lock:
+            self.__close_segment()
+            sent = 0
+            while self.segments:
+                path = self.segments[0]
+                messages = self.__read_segment(path)
+                for start in range(0, len(messages), batch_size):
+                    failed = publish(messages[start : start + batch_size])
+                    if failed:
+                        remaining = failed + messages[start + batch_size :]
+                        self.__rewrite_segment(path, remaining)
+                        sent += len(messages) - len(remaining)
+                        logging.info("Replayed " + str(sent) + " spooled messages")
+                        return False
+
+                sent += len(messages)
+                os.remove(path)
+                self.segments.pop(0)
+
+            if sent:
+                logging.info("Replayed " + str(sent) + " spooled messages")
+            return True